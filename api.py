@@ -0,0 +1,91 @@
+"""
+Вспомогательные функции JSON API (/api/v1): курсоры, выбор полей,
+представление аккаунтов и объявлений.
+
+Курсор – непрозрачная строка с id последней отданной записи; следующая
+страница начинается сразу после нее, поэтому добавление и удаление
+записей не сдвигает страницы, как при OFFSET. Суммы в API – в копейках.
+"""
+import base64
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+ACCOUNT_FIELDS = ("id", "avito_user_id", "client_id")
+AD_FIELDS = (
+    "id", "account_id", "ad_link", "search_link", "lower_range", "upper_range", "bid_step",
+    "current_bid", "max_bid", "item_id", "position", "checked_at", "check_error"
+)
+BID_FIELDS = ("id", "item_id", "current_bid", "bid_step", "max_bid", "position", "checked_at")
+
+
+class ApiError(ValueError):
+    pass
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except ValueError:
+        raise ApiError("некорректный cursor") from None
+
+
+def parse_limit(value):
+    if value in (None, ""):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError("limit должен быть целым числом") from None
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f"limit должен быть от 1 до {MAX_LIMIT}")
+    return limit
+
+
+def parse_fields(value, allowed, default=None):
+    """Поля из параметра fields=a,b,c (по умолчанию – default или все допустимые)"""
+    if not value:
+        return default or allowed
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ApiError(f"неизвестные поля: {', '.join(unknown)}; допустимы: {', '.join(allowed)}")
+    return fields
+
+
+def account_resource(account, fields):
+    return {field: getattr(account, field) for field in fields}
+
+
+def ad_resource(ad, check, fields):
+    """check – результат последней проверки позиции (AdCheck) или None"""
+    values = {
+        "id": ad.id,
+        "account_id": ad.account_id,
+        "ad_link": ad.ad_link,
+        "search_link": ad.search_link,
+        "lower_range": ad.position_range.lower,
+        "upper_range": ad.position_range.upper,
+        "bid_step": ad.bid_step,
+        "current_bid": ad.current_bid,
+        "max_bid": ad.max_bid,
+        "item_id": ad.item_id,
+        "position": check.position if check else None,
+        "checked_at": check.checked_at if check else None,
+        "check_error": check.error if check else None,
+    }
+    return {field: values[field] for field in fields}
+
+
+def page(resources, last_id, has_more):
+    """Тело ответа со страницей; next_cursor – None на последней странице"""
+    return {
+        "data": resources,
+        "next_cursor": encode_cursor(last_id) if has_more else None,
+    }
@@ -1,50 +1,157 @@
 import logging
+import os
 import time
-import re
-from flask import Flask, request, render_template_string, redirect, url_for, jsonify
-import requests
-from bs4 import BeautifulSoup
+from flask import Flask, request, render_template_string, redirect, url_for, jsonify, g, Response, stream_with_context
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
-from urllib.parse import urlparse
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
+from fetcher import SearchFetcher
+from cache import SearchCache, normalize_search_link, search_page_link
+from extractor import extract_item_id
+from parsing import PageParser, default_workers
+from store import Store
+from db import Database
+from avito_client import AvitoClient
+from tokens import TokenManager
+from bid_queue import BidUpdateQueue
+from bid_sync import BidSync, BidSyncError
+from catalog import ItemCatalog
+from polling import AdaptivePoller
+from bidding import BidController, make_strategy
+from metrics import Registry, COUNT_BUCKETS, CONTENT_TYPE, cycle_profile
+from history import PositionHistory
+import bulk
+import api
+from logs import setup_logging, TraceSampler
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.DEBUG)
+
+# Способ разбора выдачи: "fast" – потоковый сканер, "bs4" – полный разбор через BeautifulSoup
+POSITION_EXTRACTOR = os.environ.get("POSITION_EXTRACTOR", "fast")
+# Разбор выдач в пуле процессов (по умолчанию – по процессу на ядро); 0 – разбор в потоках загрузки.
+# Пул создается первым: процессы запускаются через fork, пока у приложения нет других потоков
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", default_workers()))
+page_parser = PageParser(workers=PARSE_WORKERS, engine=POSITION_EXTRACTOR)
+
+# Логи пишутся в stderr отдельным потоком через очередь; LOG_FORMAT – "json" или "text".
+# Подробные записи по каждому объявлению – только при LOG_TRACE=1 или для доли LOG_TRACE_SAMPLE выдач
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+log_listener = setup_logging(LOG_LEVEL, LOG_FORMAT)
+atexit.register(log_listener.stop)  # регистрируется первым – дописывает записи после остальных обработчиков выхода
+trace_sampler = TraceSampler(
+    enabled=os.environ.get("LOG_TRACE", "") in ("1", "true", "yes"),
+    rate=float(os.environ.get("LOG_TRACE_SAMPLE", 0))
+)
 logger = logging.getLogger(__name__)
 
-# Глобальное хранилище аккаунтов и объявлений
-accounts = []
-next_account_id = 1
-next_ad_id = 1
+# Глобальное хранилище аккаунтов и объявлений (SQLite)
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "bid_manager.db")
+database = Database(DATABASE_PATH)
+store = Store(database)
 
-# Кеш для выдач: ключ – search_link, значение – dict с "soup" и "timestamp"
-search_cache = {}
+# Кеш для выдач: ключ – нормализованный search_link, значение – словарь позиций объявлений
 CACHE_TTL = 300  # 5 минут
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1000))
+search_cache = SearchCache(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+
+# Ограничения конкурентной загрузки выдач
+FETCH_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", 16))  # всего одновременных запросов
+FETCH_PER_HOST_LIMIT = int(os.environ.get("FETCH_PER_HOST_LIMIT", 4))  # одновременных запросов к одному хосту
+FETCH_TIMEOUT = (5, 20)  # таймауты соединения и чтения, секунды
+
+# Сколько страниц выдачи можно просмотреть в поисках объявлений, ранжированных ниже первой
+SEARCH_MAX_PAGES = int(os.environ.get("SEARCH_MAX_PAGES", 10))
+
+# Общий клиент Avito API: пул соединений, таймауты и повторы при 429/5xx
+AVITO_API_URL = os.environ.get("AVITO_API_URL", "https://api.avito.ru")
+avito_client = AvitoClient(base_url=AVITO_API_URL)
+TOKEN_RENEW_BEFORE = 600  # токен обновляется заранее, за 10 минут до истечения
+
+# История позиций и ставок: по файлу на объявление в HISTORY_DIR, старые данные прореживаются до часовых
+HISTORY_DIR = os.environ.get("HISTORY_DIR", "history")
+HISTORY_FLUSH_INTERVAL = 60  # как часто накопленные отсчеты дописываются в файлы, секунды
+position_history = PositionHistory(HISTORY_DIR)
+
+# Локальный каталог объявлений аккаунтов из /core/v1/items
+CATALOG_TTL = 600  # через 10 минут после синхронизации при просмотре запускается новая (только изменения)
+CATALOG_PAGE_SIZE = 50
+# Страницы каталога запрашиваются через avito_api, чтобы попадать в метрики запросов к API
+item_catalog = ItemCatalog(database, lambda method, path, **kwargs: avito_api("items", method, path, **kwargs))
+
+search_fetcher = SearchFetcher(
+    max_workers=FETCH_MAX_WORKERS,
+    per_host_limit=FETCH_PER_HOST_LIMIT,
+    timeout=FETCH_TIMEOUT
+)
+
+# Метрики в формате Prometheus (маршрут /metrics)
+metrics = Registry()
+fetch_latency = metrics.histogram(
+    "avito_search_fetch_seconds", "Время загрузки страницы выдачи", ["status"]
+)
+parse_time = metrics.histogram("avito_search_parse_seconds", "Время разбора страницы выдачи")
+cycle_duration = metrics.histogram("avito_check_cycle_seconds", "Длительность цикла проверки позиций")
+cycle_ads = metrics.histogram(
+    "avito_check_cycle_ads", "Число объявлений, проверенных за цикл", buckets=COUNT_BUCKETS
+)
+api_latency = metrics.histogram("avito_api_request_seconds", "Время запроса к Avito API", ["operation"])
+api_requests = metrics.counter(
+    "avito_api_requests_total", "Запросы к Avito API по коду ответа", ["operation", "status"]
+)
+http_latency = metrics.histogram("http_request_seconds", "Время обработки запроса к приложению", ["endpoint"])
+bid_sync_ads = metrics.counter(
+    "avito_bid_sync_ads_total", "Объявления, проверенные сверкой ставок, по результату", ["result"]
+)
+http_requests = metrics.counter(
+    "http_requests_total", "Запросы к приложению по коду ответа", ["endpoint", "method", "status"]
+)
+# Если задан каталог, каждый цикл проверки профилируется через cProfile и сохраняется в него
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+
+def avito_api(operation, method, path, **kwargs):
+    """Запрос к Avito API с учетом в метриках; operation – имя метода API для меток"""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = avito_client.request(method, path, **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        api_latency.observe(time.perf_counter() - started, operation=operation)
+        api_requests.inc(operation=operation, status=status)
 
 # ---------------------------
 # Функции работы с токеном
 # ---------------------------
 def refresh_token(account):
-    url = "https://api.avito.ru/token/"
     data = {
         "grant_type": "client_credentials",
-        "client_id": account["client_id"],
-        "client_secret": account["client_secret"]
+        "client_id": account.client_id,
+        "client_secret": account.client_secret
     }
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    response = requests.post(url, data=data, headers=headers)
+    response = avito_api("token", "POST", "/token/", data=data, headers=headers)
     if response.status_code == 200:
         token_data = response.json()
-        account["access_token"] = token_data["access_token"]
-        account["token_expiration"] = time.time() + 24 * 3600 - 60
-        logger.info("Получен новый токен для аккаунта %s", account["id"])
-    else:
-        logger.error("Ошибка получения токена для аккаунта %s: %s", account["id"], response.text)
+        expires_in = token_data.get("expires_in", 24 * 3600)
+        store.update_account(
+            account,
+            access_token=token_data["access_token"],
+            token_expiration=time.time() + expires_in - 60
+        )
+        logger.info("Получен новый токен для аккаунта %s", account.id)
+        return True
+    logger.error("Ошибка получения токена для аккаунта %s: %s", account.id, response.text)
+    return False
+
+# Обновление токена выполняется одним потоком на аккаунт, заранее – фоновой задачей
+token_manager = TokenManager(refresh_token, renew_before=TOKEN_RENEW_BEFORE)
+avito_client.token_manager = token_manager
 
 def get_access_token(account):
-    if "access_token" not in account or time.time() > account.get("token_expiration", 0):
-        refresh_token(account)
-    return account.get("access_token", "")
+    return token_manager.get(account)
 
 # ---------------------------
 # Функции конвертации
@@ -62,22 +169,6 @@ def convert_rubles_to_kopecks(rubles_str):
         return 0
 
 # ---------------------------
-# Функция извлечения item_id из URL
-# ---------------------------
-def extract_item_id(link: str) -> str:
-    """
-    Извлекает item_id из URL объявления.
-    Например, для URL:
-    https://www.avito.ru/moskva/oborudovanie_dlya_biznesa/dizelnyy_generator_100_kvt_v_shumozaschitnom_kozhuhe_4643419676?context=...
-    функция вернет "4643419676"
-    """
-    parsed = urlparse(link)
-    path = parsed.path  # Получаем путь без query-параметров
-    match = re.search(r'(\d+)$', path)
-    if match:
-        return match.group(1)
-    return None
-# ---------------------------
 # HTML шаблоны
 # ---------------------------
 HTML_INDEX = """
@@ -144,22 +235,100 @@ HTML_ACCOUNT_DETAIL = """
     <p>access_token: {{ account.access_token }}</p>
     <h2>Объявления</h2>
     <a href="/account/{{ account.id }}/add-ad">Добавить объявление вручную</a> |
-    <a href="/account/{{ account.id }}/fetch-ads">Получить объявления из Авито</a>
-    <ul>
-    {% for ad in account.ads %}
-        <li>
-            Объявление ID: {{ ad.id }}<br>
-            ad_link: {{ ad.ad_link }}<br>
-            search_link: {{ ad.search_link if ad.search_link else "не указана" }}<br>
-            real_item_id: {{ ad.item_id if ad.item_id else "не указан" }}<br>
-            текущая ставка: {{ convert_kopecks_to_rubles(ad.current_bid) }} руб.<br>
-            (<a href="/account/{{ account.id }}/edit-ad/{{ ad.id }}">Редактировать</a>) |
-            (<a href="/account/{{ account.id }}/update-bids/{{ ad.id }}">Обновить ставки</a>)
-        </li>
-    {% endfor %}
-    </ul>
+    <a href="/account/{{ account.id }}/fetch-ads">Получить объявления из Авито</a> |
+    Выгрузить: <a href="/account/{{ account.id }}/export/ads?format=csv">CSV</a>,
+    <a href="/account/{{ account.id }}/export/ads?format=ndjson">NDJSON</a>
+    <form method="post" action="/account/{{ account.id }}/import/ads" enctype="multipart/form-data">
+        Загрузить объявления из CSV/NDJSON: <input type="file" name="file" required>
+        <input type="submit" value="Импортировать">
+    </form>
+    <ul id="ads"></ul>
+    <button id="more-ads" style="display: none">Показать еще</button>
+    <p id="ads-status">Загрузка объявлений...</p>
     <br>
     <a href="/">Вернуться к списку аккаунтов</a>
+    <script>
+        // Объявления загружаются частями из JSON API, от новых к старым
+        var adsUrl = "/api/v1/accounts/{{ account.id }}/ads?order=desc&limit={{ ads_page_size }}"
+            + "&fields=id,ad_link,search_link,item_id,current_bid,position,checked_at";
+        var nextCursor = null;
+
+        function rubles(kopecks) { return (kopecks / 100).toFixed(2); }
+
+        function line(parent, label, value, id, suffix) {
+            parent.appendChild(document.createTextNode(label));
+            var span = document.createElement("span");
+            if (id) span.id = id;
+            span.textContent = value;
+            parent.appendChild(span);
+            if (suffix) parent.appendChild(document.createTextNode(suffix));
+            parent.appendChild(document.createElement("br"));
+        }
+
+        function link(parent, href, text) {
+            var a = document.createElement("a");
+            a.href = href;
+            a.textContent = text;
+            parent.appendChild(document.createTextNode("("));
+            parent.appendChild(a);
+            parent.appendChild(document.createTextNode(")"));
+        }
+
+        function renderAd(ad) {
+            var li = document.createElement("li");
+            line(li, "Объявление ID: ", ad.id);
+            line(li, "ad_link: ", ad.ad_link);
+            line(li, "search_link: ", ad.search_link || "не указана");
+            line(li, "real_item_id: ", ad.item_id || "не указан");
+            line(li, "текущая ставка: ", rubles(ad.current_bid), "bid-" + ad.id, " руб.");
+            line(li, "позиция в выдаче: ", ad.checked_at === null ? "не проверялась" : (ad.position || "не найдено"), "position-" + ad.id);
+            link(li, "/account/{{ account.id }}/edit-ad/" + ad.id, "Редактировать");
+            li.appendChild(document.createTextNode(" | "));
+            link(li, "/account/{{ account.id }}/update-bids/" + ad.id, "Обновить ставки");
+            document.getElementById("ads").appendChild(li);
+        }
+
+        function loadAds() {
+            var status = document.getElementById("ads-status");
+            var more = document.getElementById("more-ads");
+            more.disabled = true;
+            return fetch(adsUrl + (nextCursor ? "&cursor=" + nextCursor : ""))
+                .then(function (response) { return response.json(); })
+                .then(function (page) {
+                    page.data.forEach(renderAd);
+                    nextCursor = page.next_cursor;
+                    more.style.display = nextCursor ? "" : "none";
+                    more.disabled = false;
+                    status.textContent = document.getElementById("ads").children.length ? "" : "Объявлений нет";
+                })
+                .catch(function () { status.textContent = "Не удалось загрузить объявления"; });
+        }
+
+        document.getElementById("more-ads").onclick = loadAds;
+        loadAds(){% if recheck %}.then(function () { poll(0); }){% endif %};
+    </script>
+    {% if recheck %}
+    <script>
+        // Позиция объявления после сохранения проверяется в фоне – опрашиваем статус проверки
+        function poll(attempt) {
+            var position = document.getElementById("position-{{ recheck }}");
+            if (!position) return;
+            position.textContent = "проверяется...";
+            fetch("/account/{{ account.id }}/ad/{{ recheck }}/recheck-status")
+                .then(function (response) { return response.json(); })
+                .then(function (status) {
+                    if (status.state === "pending" && attempt < 60) {
+                        setTimeout(function () { poll(attempt + 1); }, 1000);
+                        return;
+                    }
+                    position.textContent = status.state === "error" ? "ошибка проверки"
+                        : status.state === "pending" ? "проверка не завершена"
+                        : (status.position || "не найдено");
+                    document.getElementById("bid-{{ recheck }}").textContent = status.current_bid;
+                });
+        }
+    </script>
+    {% endif %}
 </body>
 </html>
 """
@@ -192,6 +361,9 @@ HTML_ADD_AD = """
         <label>Текущая ставка (в рублях):<br>
             <input type="text" name="current_bid" value="0.00" required>
         </label><br><br>
+        <label>Максимальная ставка (в рублях, 0 – без ограничения):<br>
+            <input type="text" name="max_bid" value="0.00">
+        </label><br><br>
         <button type="submit">Добавить объявление</button>
     </form>
     <br>
@@ -228,6 +400,9 @@ HTML_EDIT_AD = """
         <label>Текущая ставка (в рублях):<br>
             <input type="text" name="current_bid" value="{{ convert_kopecks_to_rubles(ad.current_bid) }}" required>
         </label><br><br>
+        <label>Максимальная ставка (в рублях, 0 – без ограничения):<br>
+            <input type="text" name="max_bid" value="{{ convert_kopecks_to_rubles(ad.max_bid) }}">
+        </label><br><br>
         <label>Реальный item_id (если известен):<br>
             <input type="text" name="item_id" value="{{ ad.item_id if ad.item_id else '' }}">
         </label><br><br>
@@ -248,6 +423,11 @@ HTML_FETCH_ADS = """
 </head>
 <body>
     <h1>Объявления для аккаунта ID: {{ account.id }}</h1>
+    <p>
+        Всего в каталоге: {{ total }}.
+        {% if syncing %}Идет синхронизация с Авито, обновите страницу позже.{% endif %}
+        (<a href="/account/{{ account.id }}/fetch-ads?refresh=1">Синхронизировать</a>)
+    </p>
     <ul>
     {% for item in ads %}
         <li>
@@ -256,6 +436,11 @@ HTML_FETCH_ADS = """
         </li>
     {% endfor %}
     </ul>
+    <p>
+        {% if page > 1 %}<a href="/account/{{ account.id }}/fetch-ads?page={{ page - 1 }}">&larr; Назад</a>{% endif %}
+        Страница {{ page }} из {{ pages }}
+        {% if page < pages %}<a href="/account/{{ account.id }}/fetch-ads?page={{ page + 1 }}">Вперед &rarr;</a>{% endif %}
+    </p>
     <br>
     <a href="/account/{{ account.id }}">Вернуться к аккаунту</a>
 </body>
@@ -268,44 +453,54 @@ app.jinja_env.globals.update(convert_kopecks_to_rubles=convert_kopecks_to_rubles
 # ---------------------------
 # Маршруты
 # ---------------------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    if "request_started" in g:
+        http_latency.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
 @app.route("/")
 def index():
-    return render_template_string(HTML_INDEX, accounts=accounts)
+    return render_template_string(HTML_INDEX, accounts=store.accounts())
 
 @app.route("/add-account", methods=["GET", "POST"])
 def add_account():
-    global accounts, next_account_id
     if request.method == "GET":
         return render_template_string(HTML_ADD_ACCOUNT)
     else:
         avito_user_id = request.form["avito_user_id"]
         client_id = request.form["client_id"]
         client_secret = request.form["client_secret"]
-        account = {
-            "id": next_account_id,
-            "avito_user_id": avito_user_id,
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "ads": [],
-            "access_token": "",
-            "token_expiration": 0
-        }
-        next_account_id += 1
-        accounts.append(account)
-        logger.info("Добавлен аккаунт ID %s с avito_user_id %s", account["id"], avito_user_id)
+        account = store.add_account(avito_user_id, client_id, client_secret)
+        logger.info("Добавлен аккаунт ID %s с avito_user_id %s", account.id, avito_user_id)
         return redirect(url_for("index"))
 
+ACCOUNT_ADS_PAGE_SIZE = 100
+
 @app.route("/account/<int:account_id>")
 def account_detail(account_id):
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
-    return render_template_string(HTML_ACCOUNT_DETAIL, account=account)
+    # Объявления страница загружает сама, частями из /api/v1/accounts/<id>/ads
+    return render_template_string(
+        HTML_ACCOUNT_DETAIL, account=account, recheck=request.args.get("recheck", type=int),
+        ads_page_size=ACCOUNT_ADS_PAGE_SIZE
+    )
 
 @app.route("/account/<int:account_id>/add-ad", methods=["GET", "POST"])
 def add_ad(account_id):
-    global next_ad_id
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
     if request.method == "GET":
@@ -317,105 +512,80 @@ def add_ad(account_id):
         upper_range = int(request.form["upper_range"])
         bid_step = convert_rubles_to_kopecks(request.form["bid_step"])
         current_bid = convert_rubles_to_kopecks(request.form["current_bid"])
+        max_bid = convert_rubles_to_kopecks(request.form.get("max_bid", "0"))
         # Автоматически извлекаем item_id из ad_link
         real_item_id = extract_item_id(ad_link)
-        ad = {
-            "id": next_ad_id,
-            "ad_link": ad_link,
-            "search_link": search_link,
-            "position_range": {"lower": lower_range, "upper": upper_range},
-            "bid_step": bid_step,
-            "current_bid": current_bid,
-            "item_id": real_item_id
-        }
-        next_ad_id += 1
-        account["ads"].append(ad)
-        logger.info("Добавлено объявление ID %s для аккаунта ID %s, real_item_id: %s", ad["id"], account["id"], real_item_id)
-        check_position_and_update()
-        return redirect(url_for("account_detail", account_id=account["id"]))
+        ad = store.add_ad(
+            account.id, ad_link, search_link, lower_range, upper_range,
+            bid_step, current_bid, real_item_id, max_bid
+        )
+        logger.info("Добавлено объявление ID %s для аккаунта ID %s, real_item_id: %s", ad.id, account.id, real_item_id)
+        schedule_recheck(ad)
+        return redirect(url_for("account_detail", account_id=account.id, recheck=ad.id))
 
 @app.route("/account/<int:account_id>/edit-ad/<int:ad_id>", methods=["GET", "POST"])
 def edit_ad(account_id, ad_id):
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
-    ad = next((item for item in account["ads"] if item["id"] == ad_id), None)
+    ad = store.get_ad(ad_id, account_id=account.id)
     if ad is None:
         return "Объявление не найдено", 404
     if request.method == "GET":
         return render_template_string(HTML_EDIT_AD, account=account, ad=ad)
     else:
-        ad["ad_link"] = request.form["ad_link"]
-        ad["search_link"] = request.form.get("search_link", "")
-        ad["position_range"]["lower"] = int(request.form["lower_range"])
-        ad["position_range"]["upper"] = int(request.form["upper_range"])
-        # Конвертируем введённые значения ставок из рублей в копейки
-        ad["bid_step"] = convert_rubles_to_kopecks(request.form["bid_step"])
-        ad["current_bid"] = convert_rubles_to_kopecks(request.form["current_bid"])
-        ad["item_id"] = request.form.get("item_id") or None
-        logger.info("Объявление ID %s для аккаунта ID %s обновлено", ad["id"], account["id"])
+        store.update_ad(
+            ad,
+            ad_link=request.form["ad_link"],
+            search_link=request.form.get("search_link", ""),
+            lower=int(request.form["lower_range"]),
+            upper=int(request.form["upper_range"]),
+            # Конвертируем введённые значения ставок из рублей в копейки
+            bid_step=convert_rubles_to_kopecks(request.form["bid_step"]),
+            current_bid=convert_rubles_to_kopecks(request.form["current_bid"]),
+            max_bid=convert_rubles_to_kopecks(request.form.get("max_bid", "0")),
+            item_id=request.form.get("item_id") or None
+        )
+        # Ставку могли изменить вручную – прежние границы стратегии больше не действуют
+        bid_controller.reset(ad.id)
+        logger.info("Объявление ID %s для аккаунта ID %s обновлено", ad.id, account.id)
         
-        # Если у объявления указан реальный item_id, отправляем запрос установки ручной ставки
-        if ad.get("item_id"):
-            payload = {
-                "actionTypeID": 5,          # Например, 5 для пакета кликов
-                "bidPenny": ad["current_bid"],# Ставка в копейках
-                "itemID": int(ad["item_id"])  # Реальный идентификатор объявления
-            }
-            api_url = "https://api.avito.ru/cpxpromo/1/setManual"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {get_access_token(account)}"
-            }
-            response = requests.post(api_url, json=payload, headers=headers)
-            if response.status_code == 200:
-                logger.info("Установка ручной ставки для объявления %s выполнена успешно", ad["id"])
-            else:
-                logger.error("Ошибка установки ручной ставки для объявления %s: %s — %s", ad["id"], response.status_code, response.text)
+        # Если у объявления указан реальный item_id, ставим в очередь установку ручной ставки
+        if ad.item_id:
+            bid_queue.submit(account, ad, ad.current_bid, force=True)
+            bid_queue.flush()
         else:
-            logger.warning("Для объявления %s не указан реальный item_id – ручная ставка не обновлена", ad["id"])
+            logger.warning("Для объявления %s не указан реальный item_id – ручная ставка не обновлена", ad.id)
         
-        check_position_and_update()
-        return redirect(url_for("account_detail", account_id=account["id"]))
+        schedule_recheck(ad)
+        return redirect(url_for("account_detail", account_id=account.id, recheck=ad.id))
 
 
 # Маршрут для получения объявлений из API Авито
 @app.route("/account/<int:account_id>/fetch-ads", methods=["GET"])
 def fetch_ads(account_id):
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
-    url = "https://api.avito.ru/core/v1/items"
-    headers = {
-        "Authorization": f"Bearer {get_access_token(account)}",
-        "Content-Type": "application/json"
-    }
-    params = {
-        "per_page": 100,
-        "page": 1,
-        "status": "active"
-    }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code != 200:
-        logger.error("Ошибка получения объявлений из Авито: %s", response.text)
-        return "Ошибка получения объявлений", response.status_code
-    data = response.json()
-    ads = data.get("resources", [])
-    return render_template_string(HTML_FETCH_ADS, account=account, ads=ads)
+    # Страница строится из локального каталога; синхронизация с Авито идет в фоне
+    if request.args.get("refresh") or time.time() - item_catalog.synced_at(account.id) > CATALOG_TTL:
+        item_catalog.sync_in_background(account)
+    page = max(request.args.get("page", 1, type=int), 1)
+    ads, total = item_catalog.page(account.id, page, CATALOG_PAGE_SIZE)
+    pages = max(1, (total + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE)
+    return render_template_string(
+        HTML_FETCH_ADS, account=account, ads=ads, total=total, page=page, pages=pages,
+        syncing=item_catalog.is_syncing(account.id)
+    )
 
 # Маршрут для добавления объявления из API по выбранному item_id
 @app.route("/account/<int:account_id>/add-ad-from-api/<int:item_id>", methods=["GET"])
 def add_ad_from_api(account_id, item_id):
-    global next_ad_id
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
-    url = f"https://api.avito.ru/core/v1/accounts/{''.join(account['avito_user_id'].split())}/items/{item_id}/"
-    headers = {
-        "Authorization": f"Bearer {get_access_token(account)}",
-        "Content-Type": "application/json"
-    }
-    response = requests.get(url, headers=headers)
+    path = f"/core/v1/accounts/{''.join(account.avito_user_id.split())}/items/{item_id}/"
+    response = avito_api("items", "GET", path, account=account)
     if response.status_code != 200:
         logger.error("Ошибка получения информации об объявлении: %s", response.text)
         return "Ошибка получения информации об объявлении", response.status_code
@@ -424,139 +594,632 @@ def add_ad_from_api(account_id, item_id):
     if not real_item_id:
         ad_url = item.get("url", "")
         real_item_id = extract_item_id(ad_url)
-    ad = {
-        "id": next_ad_id,
-        "ad_link": item.get("url", ""),
-        "search_link": "",  # Можно заполнить вручную или реализовать логику формирования
-        "position_range": {"lower": 1, "upper": 10},
-        "bid_step": convert_rubles_to_kopecks("10.00"),
-        "current_bid": convert_rubles_to_kopecks("0.00"),
-        "item_id": real_item_id
+    ad = store.add_ad(
+        account.id,
+        ad_link=item.get("url", ""),
+        search_link="",  # Можно заполнить вручную или реализовать логику формирования
+        lower=1,
+        upper=10,
+        bid_step=convert_rubles_to_kopecks("10.00"),
+        current_bid=convert_rubles_to_kopecks("0.00"),
+        item_id=real_item_id
+    )
+    logger.info("Добавлено объявление (из API) ID %s для аккаунта ID %s, real_item_id: %s", ad.id, account.id, ad.item_id)
+    schedule_recheck(ad)
+    return redirect(url_for("account_detail", account_id=account.id))
+
+# Статус фоновой проверки позиции объявления (опрашивается страницей аккаунта)
+@app.route("/account/<int:account_id>/ad/<int:ad_id>/recheck-status", methods=["GET"])
+def recheck_status(account_id, ad_id):
+    ad = store.get_ad(ad_id, account_id=account_id)
+    if ad is None:
+        return jsonify({"error": "Объявление не найдено"}), 404
+    check = ad_positions.get(ad.id)
+    requested_at = recheck_requests.get(ad.id)
+    if not ad.search_link:
+        state = "no_search_link"
+    elif check is None or (requested_at is not None and check.checked_at < requested_at):
+        state = "pending"
+    elif check.error:
+        state = "error"
+    else:
+        state = "done"
+    return jsonify({
+        "ad_id": ad.id,
+        "state": state,
+        "position": check.position if check else None,
+        "checked_at": check.checked_at if check else None,
+        "error": check.error if check else None,
+        "current_bid": convert_kopecks_to_rubles(ad.current_bid)
+    })
+
+# История позиций и ставок объявления: ?from=&to= (unix-время), ?step= – усреднение по интервалу в секундах
+@app.route("/account/<int:account_id>/ad/<int:ad_id>/history", methods=["GET"])
+def ad_history(account_id, ad_id):
+    ad = store.get_ad(ad_id, account_id=account_id)
+    if ad is None:
+        return jsonify({"error": "Объявление не найдено"}), 404
+    try:
+        start = int(request.args.get("from", 0))
+        end = int(request.args["to"]) if "to" in request.args else None
+        step = int(request.args.get("step", 0))
+    except ValueError:
+        return jsonify({"error": "from, to и step должны быть целыми числами"}), 400
+    samples = position_history.series(ad.id, start, end, step=step or None)
+    return jsonify({
+        "ad_id": ad.id,
+        "time": [t for t, _, _ in samples],
+        "position": [position for _, position, _ in samples],
+        "bid": [bid for _, _, bid in samples]
+    })
+
+# ---------------------------
+# JSON API v1: ?limit= (до 1000), ?cursor= из next_cursor предыдущей страницы,
+# ?fields=a,b,c – только нужные поля; ответы с ETag, при совпадении If-None-Match – 304
+# ---------------------------
+def api_response(payload, status=200):
+    response = jsonify(payload)
+    response.status_code = status
+    if status == 200:
+        response.add_etag()
+        response = response.make_conditional(request)
+    return response
+
+@app.errorhandler(api.ApiError)
+def api_error(error):
+    return api_response({"error": str(error)}, 400)
+
+def api_not_found(message):
+    return api_response({"error": message}, 404)
+
+@app.route("/api/v1/accounts", methods=["GET"])
+def api_accounts():
+    fields = api.parse_fields(request.args.get("fields"), api.ACCOUNT_FIELDS)
+    limit = api.parse_limit(request.args.get("limit"))
+    after_id = api.decode_cursor(request.args.get("cursor")) or 0
+    accounts = [account for account in store.accounts() if account.id > after_id][:limit + 1]
+    resources = [api.account_resource(account, fields) for account in accounts[:limit]]
+    last_id = accounts[limit - 1].id if len(accounts) > limit else None
+    return api_response(api.page(resources, last_id, len(accounts) > limit))
+
+@app.route("/api/v1/accounts/<int:account_id>", methods=["GET"])
+def api_account(account_id):
+    account = store.get_account(account_id)
+    if account is None:
+        return api_not_found("Аккаунт не найден")
+    fields = api.parse_fields(request.args.get("fields"), api.ACCOUNT_FIELDS)
+    return api_response(api.account_resource(account, fields))
+
+def api_ads_page(account_id, default_fields):
+    """Страница объявлений аккаунта; ?order=desc – от новых к старым"""
+    account = store.get_account(account_id)
+    if account is None:
+        return api_not_found("Аккаунт не найден")
+    fields = api.parse_fields(request.args.get("fields"), api.AD_FIELDS, default_fields)
+    limit = api.parse_limit(request.args.get("limit"))
+    descending = request.args.get("order") == "desc"
+    ads = store.account_ads_page(
+        account.id, api.decode_cursor(request.args.get("cursor")), limit + 1, descending=descending
+    )
+    resources = [api.ad_resource(ad, ad_positions.get(ad.id), fields) for ad in ads[:limit]]
+    last_id = ads[limit - 1].id if len(ads) > limit else None
+    return api_response(api.page(resources, last_id, len(ads) > limit))
+
+@app.route("/api/v1/accounts/<int:account_id>/ads", methods=["GET"])
+def api_ads(account_id):
+    return api_ads_page(account_id, api.AD_FIELDS)
+
+@app.route("/api/v1/accounts/<int:account_id>/bids", methods=["GET"])
+def api_bids(account_id):
+    """Те же объявления, по умолчанию – только ставки и последняя позиция"""
+    return api_ads_page(account_id, api.BID_FIELDS)
+
+@app.route("/api/v1/bid-sync", methods=["GET"])
+def api_bid_sync():
+    """Отчет последней сверки ставок с Авито (расхождения – в копейках)"""
+    report = bid_sync.last_report
+    if report is None:
+        return api_not_found("Сверка ставок еще не выполнялась")
+    return api_response(report.to_dict())
+
+@app.route("/api/v1/bid-sync", methods=["POST"])
+def api_bid_sync_run():
+    """Запускает сверку ставок в фоне, не дожидаясь планового запуска"""
+    scheduler.add_job(func=sync_bids)
+    return api_response({"status": "started"}, 202)
+
+@app.route("/api/v1/ads/<int:ad_id>", methods=["GET"])
+def api_ad(ad_id):
+    ad = store.get_ad(ad_id)
+    if ad is None:
+        return api_not_found("Объявление не найдено")
+    fields = api.parse_fields(request.args.get("fields"), api.AD_FIELDS)
+    return api_response(api.ad_resource(ad, ad_positions.get(ad.id), fields))
+
+# ---------------------------
+# Массовый импорт и экспорт (CSV или NDJSON, ?format=csv|ndjson)
+# ---------------------------
+IMPORT_CHUNK_SIZE = 500  # строк на одну транзакцию при импорте
+IMPORT_MAX_ERRORS = 100  # сколько ошибок строк возвращать в ответе
+
+def import_stream():
+    """Тело импорта: файл из формы (поле file) или само тело запроса"""
+    upload = request.files.get("file")
+    if upload is not None:
+        return upload.stream, upload.content_type
+    return request.stream, request.content_type
+
+def validated_rows(rows, parse, errors):
+    """Отдает разобранные строки, ошибки складывает в errors"""
+    for line_num, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            yield parse(row)
+        except bulk.RowError as e:
+            errors.append({"line": line_num, "error": str(e)})
+
+def import_response(imported, errors, error=None):
+    """error – почему файл не удалось дочитать; уже записанные пачки остаются в базе"""
+    body = {
+        "imported": imported,
+        "failed": len(errors),
+        "errors": errors[:IMPORT_MAX_ERRORS]
     }
-    next_ad_id += 1
-    account["ads"].append(ad)
-    logger.info("Добавлено объявление (из API) ID %s для аккаунта ID %s, real_item_id: %s", ad["id"], account["id"], ad["item_id"])
-    check_position_and_update()
-    return redirect(url_for("account_detail", account_id=account["id"]))
+    if error is not None:
+        body["error"] = error
+        return jsonify(body), 400
+    return jsonify(body), 200 if imported or not errors else 400
+
+def export_response(records, fields, filename):
+    try:
+        fmt = bulk.detect_format(request.args.get("format", "csv"))
+    except bulk.RowError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(
+        stream_with_context(bulk.write_rows(records, fields, fmt)),
+        content_type=bulk.CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={filename}.{fmt}"}
+    )
+
+@app.route("/export/accounts", methods=["GET"])
+def export_accounts():
+    records = (bulk.account_record(account) for account in store.accounts())
+    return export_response(records, bulk.ACCOUNT_FIELDS, "accounts")
+
+@app.route("/import/accounts", methods=["POST"])
+def import_accounts():
+    stream, content_type = import_stream()
+    try:
+        fmt = bulk.detect_format(request.args.get("format"), content_type)
+    except bulk.RowError as e:
+        return jsonify({"error": str(e)}), 400
+    errors = []
+    imported = 0
+    rows = validated_rows(bulk.read_rows(stream, fmt), bulk.account_row, errors)
+    try:
+        for chunk in bulk.chunked(rows, IMPORT_CHUNK_SIZE):
+            imported += len(store.add_accounts(chunk))
+    except bulk.RowError as e:
+        logger.warning("Импорт аккаунтов прерван после %d добавленных: %s", imported, e)
+        return import_response(imported, errors, str(e))
+    logger.info("Импорт аккаунтов: добавлено %d, ошибок %d", imported, len(errors))
+    return import_response(imported, errors)
+
+@app.route("/account/<int:account_id>/export/ads", methods=["GET"])
+def export_ads(account_id):
+    account = store.get_account(account_id)
+    if account is None:
+        return "Аккаунт не найден", 404
+    records = (bulk.ad_record(ad) for ad in store.iter_account_ads(account.id))
+    return export_response(records, bulk.AD_FIELDS, f"account-{account.id}-ads")
+
+@app.route("/account/<int:account_id>/import/ads", methods=["POST"])
+def import_ads(account_id):
+    """
+    Добавляет объявления из файла: строки проверяются и записываются пачками
+    по IMPORT_CHUNK_SIZE, затем выдачи всех добавленных объявлений
+    проверяются одним фоновым циклом.
+    """
+    account = store.get_account(account_id)
+    if account is None:
+        return "Аккаунт не найден", 404
+    stream, content_type = import_stream()
+    try:
+        fmt = bulk.detect_format(request.args.get("format"), content_type)
+    except bulk.RowError as e:
+        return jsonify({"error": str(e)}), 400
+    errors = []
+    added = []
+    rows = validated_rows(bulk.read_rows(stream, fmt), bulk.ad_row, errors)
+    try:
+        for chunk in bulk.chunked(rows, IMPORT_CHUNK_SIZE):
+            added.extend(store.add_ads(account.id, chunk))
+    except bulk.RowError as e:
+        logger.warning(
+            "Импорт объявлений аккаунта %s прерван после %d добавленных: %s", account.id, len(added), e
+        )
+        schedule_recheck(*added)
+        return import_response(len(added), errors, str(e))
+    logger.info("Импорт объявлений аккаунта %s: добавлено %d, ошибок %d", account.id, len(added), len(errors))
+    schedule_recheck(*added)
+    return import_response(len(added), errors)
 
 # Маршрут для обновления ставок для конкретного объявления через API
 @app.route("/account/<int:account_id>/update-bids/<int:ad_id>", methods=["GET"])
 def update_bids(account_id, ad_id):
-    account = next((acc for acc in accounts if acc["id"] == account_id), None)
+    account = store.get_account(account_id)
     if account is None:
         return "Аккаунт не найден", 404
-    ad = next((item for item in account["ads"] if item["id"] == ad_id), None)
+    ad = store.get_ad(ad_id, account_id=account.id)
     if ad is None:
         return "Объявление не найдено", 404
-    real_item_id = ad.get("item_id")
+    real_item_id = ad.item_id
     if not real_item_id:
         return "Объявлению не присвоен реальный item_id. Пожалуйста, обновите объявление и укажите его вручную.", 400
-    api_url = f"https://api.avito.ru/cpxpromo/1/getBids/{real_item_id}"
-    headers = {
-        "Authorization": f"Bearer {get_access_token(account)}",
-        "Content-Type": "application/json"
-    }
-    response = requests.get(api_url, headers=headers)
+    try:
+        bid_in_kopecks = fetch_current_bid(account, real_item_id)
+    except BidSyncError as e:
+        logger.error("Ошибка получения ставок для объявления %s: %s", ad_id, e)
+        return str(e), 400
+    logger.info("Получена ставка в копейках: %s", bid_in_kopecks)
+    # Ставка принадлежит объявлению Авито, поэтому обновляется у всех записей аккаунта с этим item_id
+    with store.batch():
+        for same_item in store.ads_by_item_id(real_item_id):
+            if same_item.account_id == account.id:
+                store.update_ad(same_item, current_bid=bid_in_kopecks)
+    logger.info("Ставка для объявления %s обновлена до %s руб.", ad.id, convert_kopecks_to_rubles(ad.current_bid))
+    return redirect(url_for("account_detail", account_id=account.id))
+
+def fetch_current_bid(account, item_id):
+    """Текущая ставка ручного продвижения объявления в Авито, в копейках"""
+    response = avito_api("getBids", "GET", f"/cpxpromo/1/getBids/{item_id}", account=account)
     if response.status_code != 200:
-        logger.error("Ошибка получения ставок для объявления %s: %s", ad_id, response.text)
-        return f"Ошибка получения ставок: {response.text}", response.status_code
+        raise BidSyncError(f"Ошибка получения ставок: {response.status_code} {response.text}")
     data = response.json()
     # Предполагаем, что для ручного продвижения ставка хранится в data["manual"]["bidPenny"]
     if "manual" in data and "bidPenny" in data["manual"]:
-        bid_in_kopecks = data["manual"]["bidPenny"]
-        logger.info("Получена ставка в копейках: %s", bid_in_kopecks)
-        ad["current_bid"] = bid_in_kopecks
-    else:
-        return "Не удалось получить ставку из ответа API", 400
-    logger.info("Ставка для объявления %s обновлена до %s руб.", ad["id"], convert_kopecks_to_rubles(ad["current_bid"]))
-    return redirect(url_for("account_detail", account_id=account["id"]))
-
-def canonical_link(link: str) -> str:
-    parsed = urlparse(link)
-    path = parsed.path
-    if path.startswith('/'):
-        path = path[1:]
-    segments = path.split('/')
-    if len(segments) > 1:
-        return '/'.join(segments[1:])
-    else:
-        return path
+        return data["manual"]["bidPenny"]
+    raise BidSyncError("Не удалось получить ставку из ответа API")
+
+def sync_bids():
+    """Плановая сверка current_bid всех объявлений со ставками в Авито"""
+    report = bid_sync.run(store.accounts())
+    if report is None:
+        return
+    bid_sync_ads.inc(report.checked - report.drift_count, result="ok")
+    bid_sync_ads.inc(report.drift_count, result="drift")
+    bid_sync_ads.inc(report.errors, result="error")
+    bid_sync_ads.inc(report.skipped, result="skipped")
+    logger.info(
+        "Сверка ставок: проверено %d, расхождений %d, ошибок %d, пропущено %d за %.1f с",
+        report.checked, report.drift_count, report.errors, report.skipped,
+        report.finished_at - report.started_at,
+        extra={
+            "event": "bid_sync", "checked": report.checked, "drifted": report.drift_count,
+            "errors": report.errors, "skipped": report.skipped,
+        }
+    )
+    for drift in report.drift:
+        logger.debug(
+            "Объявление ID %s: ставка в базе %s, в Авито %s (в копейках)",
+            drift["ad_id"], drift["stored"], drift["actual"]
+        )
 
-def check_position_and_update():
+class SearchFetchError(Exception):
+    pass
+
+def get_search_positions(search_link, revalidate=False, targets=None, depth=None):
+    """
+    Возвращает словарь позиций выдачи: ключ объявления (position_key) -> позиция.
+    Первая страница загружается всегда. Следующие страницы (параметр p)
+    загружаются по одной, только пока часть targets не найдена, а
+    просмотренные позиции не дошли до depth – наибольшей верхней границы
+    диапазона объявлений выдачи, – и не больше SEARCH_MAX_PAGES страниц.
+    Позиции на следующих страницах отсчитываются от числа ссылок на
+    предыдущих. Ошибка загрузки страницы после первой только прекращает
+    просмотр: возвращаются позиции, найденные до нее.
+    """
+    first = get_search_page(search_link, revalidate=revalidate, targets=targets)
+    positions = first.positions
+    remaining = {target for target in targets or () if target not in positions}
+    if not remaining or not depth:
+        return positions
+    positions = dict(positions)
+    page_size = scanned = first.links
+    page = 1
+    while remaining and scanned < depth and page < SEARCH_MAX_PAGES:
+        page += 1
+        try:
+            entry = get_search_page(
+                search_page_link(search_link, page), revalidate=revalidate, targets=remaining
+            )
+        except Exception as e:
+            logger.warning("Выдача %s: страница %d не получена (%s), просмотр остановлен", search_link, page, e)
+            break
+        for ad_key, position in entry.positions.items():
+            positions.setdefault(ad_key, scanned + position)
+            remaining.discard(ad_key)
+        scanned += entry.links
+        if entry.links < page_size:
+            break  # неполная страница – последняя в выдаче
+    logger.debug("Выдача %s: просмотрено страниц – %d, позиций – %d", search_link, page, scanned)
+    return positions
+
+def get_search_page(search_link, revalidate=False, targets=None):
+    """
+    Возвращает элемент кеша (CacheEntry) одной страницы выдачи: позиции и
+    число ссылок на странице. Свежий результат
+    берется из кеша без обращения к сети; устаревший (или при revalidate=True)
+    проверяется условным запросом с ETag/Last-Modified.
+    targets – ключи отслеживаемых объявлений: разбор страницы
+    останавливается, как только все они найдены.
+    """
+    key = normalize_search_link(search_link)
+    entry = search_cache.get(key)
+    if entry is not None and not entry.complete:
+        # Досрочно оборванный список годится, только если в нем есть все нужные объявления
+        if not targets or not all(target in entry.positions for target in targets):
+            entry = None
+    if entry is not None and not revalidate and search_cache.is_fresh(entry):
+        logger.debug("Выдача %s взята из кеша", search_link)
+        return entry
+    started = time.perf_counter()
+    try:
+        response = search_fetcher.fetch(search_link, headers=search_cache.conditional_headers(entry))
+    except Exception:
+        fetch_latency.observe(time.perf_counter() - started, status="error")
+        raise
+    fetch_latency.observe(time.perf_counter() - started, status=response.status_code)
+    if response.status_code == 304 and entry is not None:
+        logger.debug("Выдача %s не изменилась (304)", search_link)
+        touched = search_cache.touch(key)
+        if touched is None:
+            # Элемент успели вытеснить из кеша – возвращаем его обратно с новым временем
+            touched = search_cache.put(
+                key, entry.positions, complete=entry.complete,
+                etag=entry.etag, last_modified=entry.last_modified, links=entry.links
+            )
+        return touched
+    if response.status_code != 200:
+        raise SearchFetchError(f"код {response.status_code}")
+    with parse_time.time():
+        positions, complete, links = page_parser.parse(
+            response.content, encoding=response.encoding, targets=targets
+        )
+    return search_cache.put(
+        key, positions, complete=complete,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        links=links
+    )
+
+# Результат последней проверки каждого объявления: ad_id -> AdCheck
+AdCheck = namedtuple("AdCheck", ["position", "checked_at", "error"])
+ad_positions = {}
+# Время запроса внеплановой проверки после добавления/редактирования: ad_id -> timestamp
+recheck_requests = {}
+recheck_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recheck")
+
+def schedule_recheck(*ads):
+    """Ставит в фон одну проверку выдач этих объявлений, не дожидаясь ее"""
+    requested_at = time.time()
+    search_links = set()
+    for ad in ads:
+        if ad.search_link:
+            recheck_requests[ad.id] = requested_at
+            search_links.add(normalize_search_link(ad.search_link))
+    if search_links:
+        recheck_executor.submit(recheck_search_links, search_links)
+
+def recheck_search_links(search_links):
+    claimed = search_poller.claim(search_links)
+    for search_link in set(search_links) - set(claimed):
+        # Выдача уже проверяется – возможно, по данным до изменения, поэтому повторяем на ближайшем такте
+        search_poller.request_now(search_link)
+    if not claimed:
+        return
+    try:
+        check_search_links(claimed)
+    except Exception as e:
+        logger.error("Ошибка внеплановой проверки выдач %s: %s", ", ".join(claimed), e)
+
+def check_position_and_update(revalidate=False, search_links=None):
+    """
+    Проверяет позиции по всем выдачам или только по search_links.
+    Выдачи, которые в этот момент уже проверяются, пропускаются.
+    """
     logger.info("Запуск проверки позиций объявлений для всех аккаунтов")
+    if search_links is None:
+        search_links = store.search_links()
+    check_search_links(search_poller.claim(search_links), revalidate=revalidate)
+
+def poll_search_links():
+    """Такт адаптивного расписания: проверяет выдачи, время проверки которых наступило"""
+    search_poller.sync(store.search_links())
+    due_links = search_poller.due(limit=POLL_BATCH_LIMIT)
+    if due_links:
+        logger.info("Плановая проверка %d выдач", len(due_links))
+        # Плановая проверка всегда перепроверяет выдачи условным запросом, а не берет их из кеша
+        check_search_links(due_links, revalidate=True)
+
+def check_search_links(search_links, revalidate=False):
+    """Проверяет выдачи, уже помеченные в search_poller как проверяемые, и завершает их проверку"""
+    started = time.perf_counter()
+    with cycle_duration.time(), cycle_profile(PROFILE_DIR):
+        stats = run_check_cycle(search_links, revalidate)
+    elapsed = time.perf_counter() - started
+    cycle_ads.observe(stats["ads"])
+    # Одна итоговая запись на цикл вместо записей по каждому объявлению
+    logger.info(
+        "Цикл проверки: выдач %d, объявлений %d, найдено %d, изменено ставок %d, ошибок %d за %.2f с",
+        stats["links"], stats["ads"], stats["found"], stats["bid_changes"], stats["errors"], elapsed,
+        extra={"event": "check_cycle", "duration": round(elapsed, 3), **stats}
+    )
+
+def run_check_cycle(search_links, revalidate):
+    """Один цикл проверки выдач; возвращает счетчики цикла"""
+    stats = Counter(links=0, ads=0, found=0, not_found=0, in_range=0, bid_changes=0, errors=0)
+    # Группы по выдаче берутся прямо из индекса хранилища; ключ объявления в выдаче
+    # вычисляется в объекте объявления один раз, а не в каждом цикле
     search_groups = {}
-    for account in accounts:
-        for ad in account["ads"]:
-            if not ad["ad_link"]:
-                logger.warning("Объявление ID %s: отсутствует ссылка на объявление", ad["id"])
+    for search_link in search_links:
+        group = []
+        for ad in store.ads_by_search_link(search_link):
+            if not ad.ad_link:
+                logger.warning("Объявление ID %s: отсутствует ссылка на объявление", ad.id)
                 continue
-            if not ad.get("search_link"):
-                logger.debug("Объявление ID %s: поле search_link пустое, пропускаем проверку", ad["id"])
-                continue
-            search_groups.setdefault(ad["search_link"], []).append((account, ad))
-    
-    for search_link, group in search_groups.items():
-        try:
-            response = requests.get(search_link)
-            if response.status_code != 200:
-                logger.error("Ошибка получения выдачи по %s, код %s", search_link, response.status_code)
-                continue
-            soup = BeautifulSoup(response.text, "html.parser")
-            ad_links = soup.find_all("a", itemprop="url")
-            logger.debug("По выдаче %s: найдено %d ссылок", search_link, len(ad_links))
-            for account, ad in group:
-                user_canonical = canonical_link(ad["ad_link"])
-                logger.debug("Объявление ID %s: пользовательская ссылка (каноническая): %s", ad["id"], user_canonical)
-                ad_position = None
-                for idx, link in enumerate(ad_links, start=1):
-                    href = link.get("href", "")
-                    found_canonical = canonical_link(href)
-                    logger.debug("Элемент позиции %d: исходная href = %s, каноническая = %s", idx, href, found_canonical)
-                    if user_canonical == found_canonical:
-                        ad_position = idx
-                        logger.info("Объявление ID %s: найдено на позиции %d", ad["id"], idx)
-                        break
-                if ad_position is None:
-                    logger.info("Объявление ID %s не найдено в выдаче", ad["id"])
-                    continue
-                logger.info("Объявление ID %s: текущая позиция %s", ad["id"], ad_position)
-                lower = ad["position_range"]["lower"]
-                upper = ad["position_range"]["upper"]
-                if ad_position < lower or ad_position > upper:
-                    new_bid = ad["current_bid"] + ad["bid_step"]
-                    ad["current_bid"] = new_bid
-                    update_bid_on_avito(account, ad, new_bid)
-                    logger.info("Объявление ID %s: ставка обновлена до %s (в копейках)", ad["id"], new_bid)
-                else:
-                    logger.info("Объявление ID %s: позиция в пределах допустимого диапазона", ad["id"])
-        except Exception as e:
-            logger.error("Ошибка проверки выдачи %s: %s", search_link, e)
+            group.append((store.get_account(ad.account_id), ad, ad.position_key))
+        if group:
+            search_groups[search_link] = group
+        else:
+            search_poller.complete(search_link, None)
+
+    # Выдачи загружаются параллельно, каждая обрабатывается сразу по готовности.
+    # Изменения ставок за цикл записываются в базу одной транзакцией.
+    # Страницы после первой просматриваются до наибольшей верхней границы диапазона в группе
+    fetch = lambda link: get_search_positions(
+        link, revalidate=revalidate,
+        targets={ad_key for _, _, ad_key in search_groups[link]},
+        depth=max(ad.position_range.upper for _, ad, _ in search_groups[link])
+    )
+    with store.batch():
+        for search_link, positions, error in search_fetcher.fetch_many(search_groups, fetch):
+            signature = None
+            stats["links"] += 1
+            stats["ads"] += len(search_groups[search_link])
+            if error is not None:
+                logger.error("Ошибка получения выдачи по %s: %s", search_link, error)
+                stats["errors"] += 1
+                checked_at = time.time()
+                for _, ad, _ in search_groups[search_link]:
+                    ad_positions[ad.id] = AdCheck(None, checked_at, str(error))
+            else:
+                try:
+                    signature = process_search_page(search_link, search_groups[search_link], positions, stats)
+                except Exception as e:
+                    logger.error("Ошибка проверки выдачи %s: %s", search_link, e)
+                    stats["errors"] += 1
+            search_poller.complete(search_link, signature)
+    # Новые ставки за цикл (по одной на item_id) отправляются в Авито в фоне
+    bid_queue.flush()
+    return stats
+
+def process_search_page(search_link, group, positions, stats=None):
+    """
+    Обрабатывает выдачу; возвращает позиции объявлений группы {ad_id: позиция или None}.
+    Итоги добавляются в счетчики stats; записи по каждому объявлению пишутся,
+    только если выдача попала в трассировку (trace_sampler).
+    """
+    stats = Counter() if stats is None else stats
+    trace = trace_sampler.sample() and logger.isEnabledFor(logging.DEBUG)
+    if trace:
+        logger.debug("По выдаче %s: найдено %d ссылок", search_link, len(positions))
+    signature = {}
+    checked_at = time.time()
+    for account, ad, ad_key in group:
+        ad_position = positions.get(ad_key)
+        signature[ad.id] = ad_position
+        ad_positions[ad.id] = AdCheck(ad_position, checked_at, None)
+        # В историю пишется ставка, при которой получена эта позиция; новая попадет в следующий отсчет
+        position_history.record(ad.id, checked_at, ad_position, ad.current_bid)
+        if ad_position is None:
+            stats["not_found"] += 1
+            if trace:
+                logger.debug("Объявление ID %s не найдено в выдаче", ad.id)
+            continue
+        stats["found"] += 1
+        if trace:
+            logger.debug("Объявление ID %s: текущая позиция %s", ad.id, ad_position)
+        lower, upper = ad.position_range
+        new_bid = bid_controller.next_bid(ad, ad_position)
+        if lower <= ad_position <= upper:
+            stats["in_range"] += 1
+            if trace:
+                logger.debug("Объявление ID %s: позиция в пределах допустимого диапазона", ad.id)
+            continue
+        if new_bid is None:
+            if trace:
+                logger.debug("Объявление ID %s: позиция вне диапазона, ставка пока не меняется", ad.id)
+            continue
+        store.update_ad(ad, current_bid=new_bid)
+        stats["bid_changes"] += 1
+        if ad.item_id:
+            bid_queue.submit(account, ad, new_bid)
+        else:
+            logger.warning("Объявление ID %s: не указан реальный item_id – ставка не отправлена в Авито", ad.id)
+        logger.info(
+            "Объявление ID %s: ставка обновлена до %s (в копейках)", ad.id, new_bid,
+            extra={"event": "bid_change", "ad_id": ad.id, "position": ad_position, "bid": new_bid}
+        )
+    return signature
 
 def update_bid_on_avito(account, ad, new_bid):
-    api_url = "https://api.avito.ru/cpxpromo/1/setManual"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {get_access_token(account)}"
-    }
     data = {
         "actionTypeID": 5,          # Например, 5 для пакета кликов
         "bidPenny": new_bid,        # Новая ставка в копейках
-        "itemID": int(ad["item_id"]) 
+        "itemID": int(ad.item_id)
     }
     try:
-        response = requests.post(api_url, json=data, headers=headers)
+        response = avito_api("setManual", "POST", "/cpxpromo/1/setManual", account=account, json=data)
         if response.status_code == 200:
-            logger.info("Объявление ID %s: ставка успешно обновлена через Avito API", ad["id"])
-        else:
-            logger.error("Объявление ID %s: ошибка обновления ставки: %s — %s", ad["id"], response.status_code, response.text)
+            logger.info("Объявление ID %s: ставка успешно обновлена через Avito API", ad.id)
+            return True
+        logger.error("Объявление ID %s: ошибка обновления ставки: %s — %s", ad.id, response.status_code, response.text)
     except Exception as e:
-        logger.error("Объявление ID %s: ошибка вызова Avito API — %s", ad["id"], e)
+        logger.error("Объявление ID %s: ошибка вызова Avito API — %s", ad.id, e)
+    return False
+
+# Стратегия изменения ставки: "proportional" (по умолчанию), "bisection" или "step" (прежний +bid_step)
+BID_STRATEGY = os.environ.get("BID_STRATEGY", "proportional")
+BID_COOLDOWN = int(os.environ.get("BID_COOLDOWN", 120))  # пауза после изменения ставки, секунды
+# Нижняя граница ставки в копейках (но не меньше bid_step объявления) и доля, на которую ставку
+# можно снизить за одно изменение, – чтобы стратегия не могла сбросить ставку до нуля
+BID_MIN = int(os.environ.get("BID_MIN", 0))
+BID_MAX_DECREASE = float(os.environ.get("BID_MAX_DECREASE", 0.5))
+bid_controller = BidController(
+    make_strategy(BID_STRATEGY), cooldown=BID_COOLDOWN, min_bid=BID_MIN, max_decrease=BID_MAX_DECREASE
+)
+
+# Очередь установки ставок: схлопывает обновления одного item_id за цикл и
+# отправляет их в пуле потоков с ограничением частоты запросов на аккаунт
+BID_WORKERS = int(os.environ.get("BID_WORKERS", 4))
+BID_RATE_PER_ACCOUNT = float(os.environ.get("BID_RATE_PER_ACCOUNT", 5))  # запросов в секунду
+bid_queue = BidUpdateQueue(update_bid_on_avito, max_workers=BID_WORKERS, rate_per_account=BID_RATE_PER_ACCOUNT)
+
+# Плановая сверка current_bid с getBids: ставки могли изменить в интерфейсе Авито.
+# Отдельный пул и своя частота запросов, чтобы сверка не задерживала отправку ставок
+BID_SYNC_INTERVAL = int(os.environ.get("BID_SYNC_INTERVAL", 3600))  # секунды, 0 – не сверять
+BID_SYNC_WORKERS = int(os.environ.get("BID_SYNC_WORKERS", 4))
+BID_SYNC_RATE_PER_ACCOUNT = float(os.environ.get("BID_SYNC_RATE_PER_ACCOUNT", 2))  # запросов в секунду
+bid_sync = BidSync(
+    store, fetch_current_bid, bid_queue, workers=BID_SYNC_WORKERS, rate_per_account=BID_SYNC_RATE_PER_ACCOUNT
+)
+
+# Адаптивное расписание проверки выдач: у каждой выдачи свой интервал в пределах
+# от POLL_MIN_INTERVAL до POLL_MAX_INTERVAL в зависимости от того, как часто меняются позиции
+POLL_MIN_INTERVAL = int(os.environ.get("POLL_MIN_INTERVAL", 60))
+POLL_MAX_INTERVAL = int(os.environ.get("POLL_MAX_INTERVAL", 1800))
+POLL_TICK = 15  # как часто планировщик ищет выдачи, время проверки которых наступило, секунды
+POLL_BATCH_LIMIT = 500  # максимум выдач за один такт
+search_poller = AdaptivePoller(min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL)
 
-# Планировщик для периодической проверки каждые 5 минут
 scheduler = BackgroundScheduler()
-scheduler.add_job(func=check_position_and_update, trigger="interval", minutes=5)
+scheduler.add_job(func=poll_search_links, trigger="interval", seconds=POLL_TICK, max_instances=1, coalesce=True)
 scheduler.start()
+scheduler.add_job(func=lambda: token_manager.renew_expiring(store.accounts()), trigger="interval", minutes=1)
+scheduler.add_job(func=position_history.flush, trigger="interval", seconds=HISTORY_FLUSH_INTERVAL)
+scheduler.add_job(func=position_history.compact, trigger="interval", hours=24)
+if BID_SYNC_INTERVAL:
+    scheduler.add_job(func=sync_bids, trigger="interval", seconds=BID_SYNC_INTERVAL, max_instances=1, coalesce=True)
 atexit.register(lambda: scheduler.shutdown())
+atexit.register(search_fetcher.shutdown)
+atexit.register(avito_client.close)
+atexit.register(bid_queue.shutdown)
+atexit.register(item_catalog.shutdown)
+atexit.register(lambda: recheck_executor.shutdown(wait=False))
+atexit.register(page_parser.shutdown)
+atexit.register(position_history.flush)
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
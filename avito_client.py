@@ -0,0 +1,67 @@
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class AvitoClient:
+    """
+    Общий HTTP-клиент для всех вызовов Avito API.
+    Держит пул keep-alive соединений на хост, задает таймауты соединения
+    и чтения и повторяет запросы с экспоненциальной паузой при 429 и 5xx
+    (с учетом заголовка Retry-After).
+
+    Если передан account, токен берется из token_manager, а при ответе 401
+    токен сбрасывается и запрос один раз повторяется с новым.
+    """
+
+    def __init__(self, base_url="https://api.avito.ru", timeout=(3.05, 15), retries=3,
+                 backoff_factor=0.5, pool_size=10, token_manager=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token_manager = token_manager
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def request(self, method, path, account=None, token=None, headers=None, **kwargs):
+        if account is None or self.token_manager is None:
+            return self._send(method, path, token, headers, **kwargs)
+        token = self.token_manager.get(account)
+        response = self._send(method, path, token, headers, **kwargs)
+        if response.status_code == 401:
+            self.token_manager.invalidate(account, token)
+            token = self.token_manager.get(account)
+            response = self._send(method, path, token, headers, **kwargs)
+        return response
+
+    def _send(self, method, path, token, headers, **kwargs):
+        url = path if path.startswith("http") else self.base_url + path
+        headers = dict(headers or {})
+        if token is not None:
+            headers["Authorization"] = f"Bearer {token}"
+        kwargs.setdefault("timeout", self.timeout)
+        return self._session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,215 @@
+"""
+Нагрузочный бенчмарк цикла проверки позиций без обращения к avito.ru.
+
+Запускает benchmarks/fake_avito.py отдельным процессом, направляет на него
+приложение (AVITO_API_URL, ссылки на выдачу), создает во временной базе
+--accounts аккаунтов и --ads объявлений, распределенных по --links выдачам,
+и несколько раз выполняет check_position_and_update. Для каждого цикла
+выводятся время цикла, число запросов выдачи и их частота, число
+отправленных setManual и время их отправки, пиковая память процесса.
+
+Позиции объявлений случайны в пределах первых страниц выдачи, диапазоны
+выбраны так, что примерно половина объявлений оказывается вне диапазона
+и получает новую ставку.
+
+Использование:
+    python benchmarks/bench_cycle.py --ads 1000 --links 100
+    python benchmarks/bench_cycle.py --ads 1000,10000,50000 --links 500 --latency 0.1
+    python benchmarks/bench_cycle.py --ads 5000 --json >> results.jsonl
+
+Несколько значений --ads запускаются по очереди в отдельных процессах.
+Настройки приложения (FETCH_MAX_WORKERS, PARSE_WORKERS и т.д.) берутся из
+окружения как обычно.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+
+from benchmarks.fake_avito import search_item_id  # noqa: E402
+from benchmarks.pages import item_href  # noqa: E402
+
+
+def start_server(args):
+    command = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_avito.py"), "--port", "0",
+        "--anchors", str(args.anchors), "--max-pages", str(args.max_pages),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+    ]
+    if args.etag:
+        command.append("--etag")
+    if args.pages_dir:
+        command.extend(["--pages-dir", args.pages_dir])
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def server_stats(base_url):
+    return requests.get(base_url + "/__stats", timeout=10).json()
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux – в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def recorded_links(base_url, search):
+    from extractor import extract_links
+    html = requests.get(f"{base_url}/search/{search}", timeout=30).text
+    return [href if href.startswith("http") else "https://www.avito.ru" + href for href in extract_links(html)[0]]
+
+
+def populate(app, args, base_url):
+    """Создает аккаунты и объявления; возвращает время создания"""
+    rnd = random.Random(args.seed)
+    started = time.perf_counter()
+    accounts = [app.store.add_account(f"user{n}", f"client{n}", "secret") for n in range(args.accounts)]
+    per_link, extra = divmod(args.ads, args.links)
+    depth_pages = args.depth_pages
+    if depth_pages is None:
+        # Столько первых страниц, сколько нужно, чтобы объявления выдачи на них поместились
+        depth_pages = max(1, -(-(per_link + (1 if extra else 0)) // args.anchors))
+    depth = args.anchors * min(depth_pages, args.max_pages)
+    for search in range(args.links):
+        count = per_link + (1 if search < extra else 0)
+        if count > depth:
+            raise SystemExit(f"На выдачу приходится {count} объявлений, а в {min(depth_pages, args.max_pages)} страницах только {depth}")
+        search_link = f"{base_url}/search/{search}"
+        if args.pages_dir:
+            hrefs = recorded_links(base_url, search)[:count]
+            ranks = list(range(1, len(hrefs) + 1))
+        else:
+            ranks = rnd.sample(range(1, depth + 1), count)
+            hrefs = []
+            for rank in ranks:
+                page, slot = divmod(rank - 1, args.anchors)
+                item_id = search_item_id(search, page + 1, slot + 1, args.anchors)
+                hrefs.append("https://www.avito.ru" + item_href(item_id))
+        for rank, href in zip(ranks, hrefs):
+            upper = max(1, rank + rnd.randint(-5, 5))
+            app.store.add_ad(
+                rnd.choice(accounts).id, href, search_link, max(1, upper - 5), upper,
+                100, 1000, app.extract_item_id(href)
+            )
+    return time.perf_counter() - started
+
+
+def run(args):
+    server, base_url = start_server(args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+            os.environ["AVITO_API_URL"] = base_url
+            os.environ["HISTORY_DIR"] = os.path.join(tmp, "history")
+            os.environ.setdefault("BID_RATE_PER_ACCOUNT", str(args.bid_rate))
+            os.environ.setdefault("BID_COOLDOWN", "0")
+            import logging
+            logging.disable(logging.INFO)
+            import app
+            app.scheduler.pause()  # плановые проверки не должны вмешиваться в замеры
+
+            setup = populate(app, args, base_url)
+            result = {
+                "ads": args.ads, "links": args.links, "accounts": args.accounts,
+                "latency": args.latency, "setup_seconds": round(setup, 3), "cycles": [],
+            }
+            if not args.json:
+                print(f"Объявлений: {args.ads}, выдач: {args.links}, аккаунтов: {args.accounts}, "
+                      f"создание: {setup:.2f} с")
+            if args.tracemalloc:
+                tracemalloc.start()
+            for cycle in range(1, args.cycles + 1):
+                before = server_stats(base_url)
+                if args.tracemalloc:
+                    tracemalloc.reset_peak()
+                started = time.perf_counter()
+                app.check_position_and_update(revalidate=True)
+                elapsed = time.perf_counter() - started
+                app.bid_queue.join()
+                bids_elapsed = time.perf_counter() - started - elapsed
+                after = server_stats(base_url)
+                searches = after.get("search", 0) - before.get("search", 0)
+                stats = {
+                    "cycle": cycle,
+                    "seconds": round(elapsed, 3),
+                    "search_requests": searches,
+                    "not_modified": after.get("search_304", 0) - before.get("search_304", 0),
+                    "requests_per_second": round(searches / elapsed, 1) if elapsed else None,
+                    "set_manual": after.get("setManual", 0) - before.get("setManual", 0),
+                    "bids_seconds": round(bids_elapsed, 3),
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                }
+                if args.tracemalloc:
+                    stats["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+                result["cycles"].append(stats)
+                if not args.json:
+                    line = (f"Цикл {cycle}: {elapsed:7.2f} с, выдач {searches} ({stats['requests_per_second']} запр/с, "
+                            f"304: {stats['not_modified']}), setManual {stats['set_manual']} за {bids_elapsed:.2f} с, "
+                            f"пик RSS {stats['peak_rss_mb']} МБ")
+                    if args.tracemalloc:
+                        line += f", пик Python {stats['peak_python_mb']} МБ"
+                    print(line)
+            if args.json:
+                print(json.dumps(result, ensure_ascii=False))
+            app.position_history.flush()  # пока временный каталог истории еще существует
+            app.database.close()
+            return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ads", default="1000", help="число объявлений; несколько значений через запятую")
+    parser.add_argument("--links", type=int, default=100, help="число выдач")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--anchors", type=int, default=50, help="объявлений на странице выдачи")
+    parser.add_argument("--max-pages", type=int, default=10, help="страниц в каждой выдаче")
+    parser.add_argument(
+        "--depth-pages", type=int,
+        help="на скольких первых страницах размещаются объявления (по умолчанию – сколько нужно для --ads/--links)"
+    )
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа сервера, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--etag", action="store_true", help="сервер отвечает 304 на повторные запросы")
+    parser.add_argument("--pages-dir", help="сохраненные страницы выдачи вместо синтетических")
+    parser.add_argument("--bid-rate", type=float, default=1000, help="BID_RATE_PER_ACCOUNT, если не задан в окружении")
+    parser.add_argument("--tracemalloc", action="store_true", help="замерять пик памяти Python (замедляет цикл)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести результат одной строкой JSON")
+    args = parser.parse_args()
+
+    scales = [int(value) for value in args.ads.split(",")]
+    if len(scales) == 1:
+        args.ads = scales[0]
+        run(args)
+        return 0
+    # Каждый масштаб – в отдельном процессе: приложение хранит состояние на уровне модуля
+    argv, rest = [], iter(sys.argv[1:])
+    for arg in rest:
+        if arg == "--ads":
+            next(rest, None)
+        elif not arg.startswith("--ads="):
+            argv.append(arg)
+    for ads in scales:
+        code = subprocess.call([sys.executable, os.path.abspath(__file__), "--ads", str(ads)] + argv)
+        if code:
+            return code
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
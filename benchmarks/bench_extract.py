@@ -0,0 +1,80 @@
+"""
+Сравнение быстрого сканера и разбора через BeautifulSoup на страницах выдачи.
+
+Использование:
+    python benchmarks/bench_extract.py сохраненные/*.html
+    python benchmarks/bench_extract.py --synthetic 50 --pages 20
+
+Для каждой страницы проверяется, что оба способа вернули одинаковые ссылки.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extractor import extract_links, extract_links_bs4  # noqa: E402
+from benchmarks.pages import make_page  # noqa: E402
+
+
+def load_pages(args):
+    if args.files:
+        pages = []
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append((os.path.basename(path), f.read()))
+        return pages
+    return [
+        (f"synthetic-{n}", make_page(range(n * 1000, n * 1000 + args.synthetic), seed=n))
+        for n in range(args.pages)
+    ]
+
+
+def measure(func, pages, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _, html in pages:
+            func(html)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="сохраненные HTML-страницы выдачи Авито")
+    parser.add_argument("--synthetic", type=int, default=50, help="объявлений на синтетической странице")
+    parser.add_argument("--pages", type=int, default=20, help="число синтетических страниц")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    mismatches = 0
+    for name, html in pages:
+        fast, _ = extract_links(html)
+        if fast != extract_links_bs4(html):
+            mismatches += 1
+            print(f"РАСХОЖДЕНИЕ: {name}")
+
+    total_mb = sum(len(html) for _, html in pages) / 2 ** 20
+    bs4_time = measure(extract_links_bs4, pages, args.repeat)
+    fast_time = measure(extract_links, pages, args.repeat)
+    # Досрочная остановка: ищем объявление из середины каждой страницы
+    middle = {}
+    for _, html in pages:
+        links = extract_links_bs4(html)
+        middle[html] = {links[len(links) // 2]} if links else set()
+    early_time = measure(lambda html: extract_links(html, targets=middle[html], key=lambda href: href), pages, args.repeat)
+
+    per_page = lambda seconds: seconds / len(pages) * 1000
+    print(f"Страниц: {len(pages)}, объем {total_mb:.1f} МБ, расхождений: {mismatches}")
+    print(f"BeautifulSoup:               {per_page(bs4_time):8.2f} мс/стр")
+    print(f"Быстрый сканер:              {per_page(fast_time):8.2f} мс/стр  (x{bs4_time / fast_time:.1f})")
+    print(f"Сканер с досрочной остановкой: {per_page(early_time):6.2f} мс/стр  (x{bs4_time / early_time:.1f})")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Локальная замена Авито для бенчмарков: выдача и Avito API на одном порту.
+
+Выдача: GET /search/<номер>?p=<страница> – синтетическая страница
+(benchmarks/pages.py) с --anchors ссылками <a itemprop="url">. На
+странице p выдачи n находятся объявления search_item_id(n, p, 1..anchors);
+после --max-pages страниц выдача заканчивается (пустая страница).
+С --pages-dir вместо синтетических отдаются сохраненные HTML-файлы
+по кругу. Каждый ответ задерживается на --latency (+ случайно до --jitter)
+секунд, с --etag страницы отдаются с ETag и отвечают 304 на If-None-Match.
+
+Avito API:
+    POST /token/                        – токен на сутки
+    GET  /core/v1/items                 – --items объявлений, страницами per_page
+    GET  /cpxpromo/1/getBids/<item_id>  – {"manual": {"bidPenny": ...}}
+    POST /cpxpromo/1/setManual          – {"success": true}
+    GET  /__stats                       – число запросов по каждому методу
+
+Использование:
+    python benchmarks/fake_avito.py --port 8080 --anchors 50 --latency 0.2
+При --port 0 порт выбирается свободный; первая строка вывода – адрес сервера.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.pages import make_page  # noqa: E402
+
+ITEMS_PER_SEARCH = 10 ** 5
+
+
+def search_item_id(search, page, slot, anchors):
+    """item_id объявления на месте slot (с 1) страницы page выдачи search"""
+    return search * ITEMS_PER_SEARCH + (page - 1) * anchors + slot
+
+
+class FakeAvito:
+    def __init__(self, anchors=50, max_pages=10, latency=0.0, jitter=0.0, etag=False,
+                 items=1000, pages_dir=None, page_cache=1024):
+        self.anchors = anchors
+        self.max_pages = max_pages
+        self.latency = latency
+        self.jitter = jitter
+        self.etag = etag
+        self.items = items
+        self.recorded = []
+        if pages_dir:
+            for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+                with open(path, "rb") as f:
+                    self.recorded.append(f.read())
+        self.stats = {}
+        self._lock = threading.Lock()
+        self.render = lru_cache(maxsize=page_cache)(self._render)
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def _render(self, search, page):
+        if self.recorded:
+            return self.recorded[(search * self.max_pages + page) % len(self.recorded)]
+        if page > self.max_pages:
+            return make_page([], seed=search).encode()
+        ids = [search_item_id(search, page, slot, self.anchors) for slot in range(1, self.anchors + 1)]
+        return make_page(ids, seed=search * 1000 + page).encode()
+
+    def item(self, n):
+        return {
+            "id": n, "title": f"Объявление {n}", "status": "active", "price": 1000 + n,
+            "url": f"https://www.avito.ru/moskva/oborudovanie_dlya_biznesa/tovar_{n}",
+        }
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Заголовки и тело уходят отдельными записями: без TCP_NODELAY алгоритм Нейгла
+        # вместе с отложенным ACK добавлял бы к каждому небольшому ответу около 40 мс
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_body(self, status, body, content_type="application/json", headers=()):
+            if not isinstance(body, bytes):
+                body = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            parts = url.path.strip("/").split("/")
+            if parts[0] == "search" and len(parts) == 2:
+                fake.count("search")
+                fake.delay()
+                page = int(query.get("p", ["1"])[0])
+                etag = f'"{parts[1]}-{page}"'
+                if fake.etag and self.headers.get("If-None-Match") == etag:
+                    fake.count("search_304")
+                    return self.send_body(304, b"")
+                headers = [("ETag", etag)] if fake.etag else []
+                body = fake.render(int(parts[1]), page)
+                return self.send_body(200, body, "text/html; charset=utf-8", headers)
+            if url.path == "/core/v1/items":
+                fake.count("items")
+                fake.delay()
+                per_page = int(query.get("per_page", ["25"])[0])
+                page = int(query.get("page", ["1"])[0])
+                first = (page - 1) * per_page + 1
+                last = min(first + per_page, fake.items + 1)
+                return self.send_body(200, {"resources": [fake.item(n) for n in range(first, last)]})
+            if url.path.startswith("/cpxpromo/1/getBids/"):
+                fake.count("getBids")
+                fake.delay()
+                return self.send_body(200, {"manual": {"bidPenny": 1000}})
+            if url.path == "/__stats":
+                with fake._lock:
+                    return self.send_body(200, dict(fake.stats))
+            self.send_body(404, {"error": "not found"})
+
+        def do_POST(self):
+            self.read_body()
+            if self.path == "/token/":
+                fake.count("token")
+                return self.send_body(200, {"access_token": "bench-token", "expires_in": 86400})
+            if self.path == "/cpxpromo/1/setManual":
+                fake.count("setManual")
+                fake.delay()
+                return self.send_body(200, {"success": True})
+            self.send_body(404, {"error": "not found"})
+
+    return Handler
+
+
+def serve(fake, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--anchors", type=int, default=50, help="объявлений на странице выдачи")
+    parser.add_argument("--max-pages", type=int, default=10, help="страниц в каждой выдаче")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, секунды")
+    parser.add_argument("--etag", action="store_true", help="отдавать ETag и отвечать 304")
+    parser.add_argument("--items", type=int, default=1000, help="объявлений в /core/v1/items")
+    parser.add_argument("--pages-dir", help="каталог с сохраненными страницами выдачи *.html")
+    args = parser.parse_args()
+
+    fake = FakeAvito(
+        anchors=args.anchors, max_pages=args.max_pages, latency=args.latency, jitter=args.jitter,
+        etag=args.etag, items=args.items, pages_dir=args.pages_dir
+    )
+    server = serve(fake, args.host, args.port)
+    print(f"http://{server.server_address[0]}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Генерация синтетических страниц выдачи, похожих по структуре на выдачу Авито:
+карточки с вложенной разметкой, ссылки <a itemprop="url">, служебные ссылки
+без itemprop, встроенные скрипты и стили.
+"""
+import random
+
+CARD = """
+<div data-marker="item" data-item-id="{item_id}" class="iva-item-root iva-item-list" itemscope itemtype="http://schema.org/Product">
+  <div class="iva-item-slider"><a href="{href}" class="photo-slider-root" data-marker="item-photo"><img src="https://00.img.avito.st/image/1/{item_id}.jpg" alt="{title}"></a></div>
+  <div class="iva-item-body">
+    <div class="iva-item-titleStep"><a href="{href}" itemprop="url" data-marker="item-title" title="{title} в {city}" class="styles-link link-link"><h3 itemprop="name" class="title-root">{title}</h3></a></div>
+    <div class="iva-item-priceStep"><span class="price-text" data-marker="item-price"><meta itemprop="priceCurrency" content="RUB"><meta itemprop="price" content="{price}">{price}&nbsp;₽</span></div>
+    <div class="iva-item-descriptionStep"><p>{description}</p></div>
+    <div class="geo-root"><span>{city}</span> <a href="/{city}/rayon" class="geo-link">Район</a></div>
+    <!-- <a itemprop="url" href="/commented/out_1"> -->
+  </div>
+</div>
+"""
+
+HEAD = """<!DOCTYPE html><html lang="ru"><head><meta charset="UTF-8"><title>Выдача</title>
+<style>.iva-item-root > a{color:red}</style>
+<script>window.__initialData__ = "{\\"items\\":[\\"<a itemprop='url' href='/in/script_1'>\\"]}";</script>
+</head><body><div class="index-root"><div class="items-items" data-marker="catalog-serp">
+"""
+TAIL = """</div></div><script src="/s/app.js"></script></body></html>"""
+
+WORDS = ["генератор", "дизельный", "кожух", "шумозащитный", "кВт", "новый", "б/у", "доставка", "гарантия", "аренда"]
+
+
+def item_href(item_id, city="moskva", category="oborudovanie_dlya_biznesa"):
+    return f"/{city}/{category}/tovar_{item_id}"
+
+
+def make_page(item_ids, seed=0, city="moskva"):
+    """Страница выдачи с карточками item_ids в заданном порядке"""
+    rnd = random.Random(seed)
+    parts = [HEAD]
+    for item_id in item_ids:
+        title = " ".join(rnd.choice(WORDS) for _ in range(5))
+        parts.append(CARD.format(
+            item_id=item_id,
+            href=item_href(item_id, city) + "?context=" + "x" * rnd.randint(40, 120),
+            title=title,
+            city=city,
+            price=rnd.randint(1000, 10 ** 6),
+            description=" ".join(rnd.choice(WORDS) for _ in range(60))
+        ))
+    parts.append(TAIL)
+    return "".join(parts)
@@ -0,0 +1,92 @@
+"""
+Офлайн-сравнение стратегий ставок на модели аукциона.
+
+Модель: в выдаче N конкурентов, у каждого своя ставка и коэффициент
+качества; место объявления – 1 + число конкурентов с большим произведением
+ставки на качество. Ставки конкурентов медленно дрейфуют. На каждом шаге
+стратегия видит только текущую позицию, как при реальной проверке выдачи.
+
+Использование:
+    python benchmarks/simulate_auction.py --scenarios 200 --steps 100
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bidding import BidController, STRATEGIES  # noqa: E402
+from store import Ad, PositionRange  # noqa: E402
+
+
+class SimulatedAuction:
+    def __init__(self, seed, competitors=60, drift=0.02):
+        self.rnd = random.Random(seed)
+        self.drift = drift
+        self.competitors = [
+            (self.rnd.lognormvariate(8, 0.8), self.rnd.uniform(0.5, 1.5)) for _ in range(competitors)
+        ]
+
+    def position(self, bid):
+        return 1 + sum(1 for other, quality in self.competitors if other * quality > bid)
+
+    def min_bid_for(self, position):
+        """Наименьшая ставка, дающая позицию не хуже заданной"""
+        scores = sorted((other * quality for other, quality in self.competitors), reverse=True)
+        return int(scores[position - 1]) + 1 if position <= len(scores) else 0
+
+    def step(self):
+        self.competitors = [
+            (other * self.rnd.lognormvariate(0, self.drift), quality) for other, quality in self.competitors
+        ]
+
+
+def run(strategy_name, scenario, steps, lower, upper, bid_step):
+    auction = SimulatedAuction(scenario)
+    ad = Ad(1, 1, "", "", PositionRange(lower, upper), bid_step, 0, "1")
+    controller = BidController(STRATEGIES[strategy_name](), cooldown=0)
+    reached, writes, in_range, overpay = None, 0, 0, 0
+    for t in range(steps):
+        position = auction.position(ad.current_bid)
+        if lower <= position <= upper:
+            in_range += 1
+            reached = t if reached is None else reached
+            overpay += max(ad.current_bid - auction.min_bid_for(upper), 0)
+        new_bid = controller.next_bid(ad, position, now=float(t + 1))
+        if new_bid is not None:
+            ad.current_bid = new_bid
+            writes += 1
+        auction.step()
+    return reached, writes, in_range, overpay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--lower", type=int, default=3)
+    parser.add_argument("--upper", type=int, default=8)
+    parser.add_argument("--bid-step", type=int, default=1000, help="шаг ставки в копейках")
+    args = parser.parse_args()
+
+    print(f"{'стратегия':<14}{'шагов до цели':>15}{'не достигли':>13}{'запросов':>10}{'в диапазоне':>13}{'переплата':>12}")
+    for name in STRATEGIES:
+        results = [
+            run(name, scenario, args.steps, args.lower, args.upper, args.bid_step)
+            for scenario in range(args.scenarios)
+        ]
+        reached = [r[0] for r in results if r[0] is not None]
+        in_range_steps = sum(r[2] for r in results)
+        print(
+            f"{name:<14}"
+            f"{(sum(reached) / len(reached) if reached else float('nan')):>15.1f}"
+            f"{len(results) - len(reached):>13}"
+            f"{sum(r[1] for r in results) / len(results):>10.1f}"
+            f"{in_range_steps / (len(results) * args.steps):>12.0%}"
+            f"{(sum(r[3] for r in results) / in_range_steps / 100 if in_range_steps else 0):>11.2f}р"
+        )
+
+
+if __name__ == "__main__":
+    main()
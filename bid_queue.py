@@ -0,0 +1,205 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket: не больше rate запросов в секунду, кратковременно до burst подряд"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Забирает токен, если он есть, и возвращает 0; иначе – через сколько секунд он появится"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            time.sleep(delay)
+
+
+class AccountDispatcher:
+    """
+    Передает задачи в пул потоков с ограничением частоты на аккаунт.
+
+    Задачи ждут в очереди своего аккаунта здесь, а не в потоках пула:
+    задача попадает в пул, только когда у ее аккаунта есть токен, поэтому
+    аккаунт с большим числом задач не занимает все потоки и не задерживает
+    остальные. Аккаунты, у которых есть и задачи, и токены, обслуживаются
+    по очереди.
+    """
+
+    def __init__(self, executor, rate_per_account):
+        self._executor = executor
+        self.rate_per_account = rate_per_account
+        self._queues = {}    # account_id -> deque((fn, args, future))
+        self._limiters = {}
+        self._ready = []     # (когда аккаунт может отправить следующую задачу, номер, account_id)
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, account_id, fn, *args):
+        future = Future()
+        with self._cond:
+            queue = self._queues.get(account_id)
+            if queue is None:
+                queue = self._queues[account_id] = deque()
+                heapq.heappush(self._ready, (time.monotonic(), next(self._order), account_id))
+                self._cond.notify()
+            queue.append((fn, args, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="bid-dispatch", daemon=True)
+                self._thread.start()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                task = None
+                while task is None:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    if not self._ready or self._ready[0][0] > now:
+                        self._cond.wait(self._ready[0][0] - now if self._ready else None)
+                        continue
+                    _, _, account_id = heapq.heappop(self._ready)
+                    limiter = self._limiters.get(account_id)
+                    if limiter is None:
+                        limiter = self._limiters[account_id] = RateLimiter(self.rate_per_account)
+                    delay = limiter.try_acquire()
+                    if delay:
+                        heapq.heappush(self._ready, (now + delay, next(self._order), account_id))
+                        continue
+                    queue = self._queues[account_id]
+                    task = queue.popleft()
+                    if queue:
+                        heapq.heappush(self._ready, (now, next(self._order), account_id))
+                    else:
+                        del self._queues[account_id]
+            fn, args, future = task
+            try:
+                self._executor.submit(self._call, fn, args, future)
+            except RuntimeError as e:  # пул уже остановлен
+                future.set_exception(e)
+
+    @staticmethod
+    def _call(fn, args, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+class BidUpdateQueue:
+    """
+    Асинхронная очередь установки ставок (cpxpromo setManual).
+
+    submit() только запоминает ставку: повторные обновления одного item_id
+    до flush() схлопываются в одно с последним значением. flush() отправляет
+    накопленное через пул потоков, соблюдая ограничение частоты запросов
+    для каждого аккаунта (AccountDispatcher), и пропускает ставки, равные
+    уже отправленным.
+    """
+
+    def __init__(self, send, max_workers=4, rate_per_account=5):
+        self._send = send  # send(account, ad, bid) -> True при успехе
+        self.rate_per_account = rate_per_account
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bid-update")
+        self._dispatcher = AccountDispatcher(self._executor, rate_per_account)
+        self._pending = {}   # item_id -> (account, ad, bid, force)
+        self._sent = {}      # item_id -> последняя успешно установленная ставка
+        self._in_flight = {}  # отправки, которые еще не завершились: future -> item_id
+        self._lock = threading.Lock()
+
+    def submit(self, account, ad, bid, force=False):
+        """force=True отправляет ставку, даже если она совпадает с уже отправленной"""
+        key = str(ad.item_id)
+        with self._lock:
+            previous = self._pending.get(key)
+            self._pending[key] = (account, ad, bid, force or (previous is not None and previous[3]))
+
+    def flush(self, wait=False):
+        """Отправляет накопленные ставки; при wait=True дожидается завершения"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        submitted = {}
+        for key, (account, ad, bid, force) in pending.items():
+            if not force and self._sent.get(key) == bid:
+                logger.debug("Объявление ID %s: ставка %s не изменилась, запрос не нужен", ad.id, bid)
+                continue
+            submitted[self._dispatcher.submit(account.id, self._dispatch, key, account, ad, bid)] = key
+        with self._lock:
+            self._in_flight.update(submitted)
+        futures = list(submitted)
+        for future in futures:
+            future.add_done_callback(self._done)
+        if wait and futures:
+            wait_futures(futures)
+        return futures
+
+    def join(self):
+        """Дожидается завершения всех уже отправленных flush() ставок"""
+        with self._lock:
+            futures = list(self._in_flight)
+        if futures:
+            wait_futures(futures)
+
+    def _done(self, future):
+        with self._lock:
+            self._in_flight.pop(future, None)
+
+    def busy(self, item_id):
+        """Есть ли у item_id ставка, ожидающая отправки или еще отправляемая"""
+        key = str(item_id)
+        with self._lock:
+            return key in self._pending or key in self._in_flight.values()
+
+    def forget(self, item_id):
+        """Забывает отправленную ставку item_id, например если ее изменили в самом Авито"""
+        with self._lock:
+            self._sent.pop(str(item_id), None)
+
+    def _dispatch(self, key, account, ad, bid):
+        try:
+            ok = self._send(account, ad, bid)
+        except Exception as e:
+            logger.error("Объявление ID %s: ошибка отправки ставки — %s", ad.id, e)
+            ok = False
+        if ok:
+            with self._lock:
+                self._sent[key] = bid
+        return ok
+
+    def shutdown(self):
+        self._dispatcher.shutdown()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,170 @@
+"""
+Сверка текущих ставок объявлений с Авито (cpxpromo getBids).
+
+Ставку можно изменить и в интерфейсе Авито, тогда current_bid в базе
+расходится с настоящей, и следующий шаг ставки считается от устаревшего
+значения. run() запрашивает getBids для всех объявлений с item_id через
+пул из workers потоков с ограничением частоты запросов на аккаунт.
+Объявления аккаунтов перебираются прямо из базы по очереди: следующее
+объявление аккаунта попадает в пул, только когда у аккаунта есть токен,
+так что ожидание лимита не занимает потоки пула и большой аккаунт не
+задерживает остальные. В пуле одновременно не больше 2 * workers запросов,
+поэтому все объявления в памяти не держатся.
+
+Расхождения записываются в базу одной транзакцией в конце. Объявление
+пропускается, если его ставка изменилась локально за время сверки или
+отправка ставки в Авито еще не завершилась (busy): тогда ответ getBids
+мог устареть. Для исправленных объявлений очередь ставок забывает
+последнюю отправленную ставку, иначе возврат к ней был бы пропущен как
+повторный. Результат – отчет о найденных расхождениях (BidSyncReport).
+"""
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bid_queue import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+SKIPPED = object()  # ставка объявления как раз отправляется в Авито – сверять нечего
+
+
+class BidSyncError(Exception):
+    pass
+
+
+class BidSyncReport:
+    def __init__(self, started_at, drift_limit=1000):
+        self.started_at = started_at
+        self.finished_at = None
+        self.checked = 0
+        self.errors = 0
+        self.skipped = 0
+        self.drift_count = 0
+        self.drift = []  # первые drift_limit расхождений
+        self.drift_limit = drift_limit
+
+    def add_drift(self, ad, stored, actual):
+        self.drift_count += 1
+        if len(self.drift) < self.drift_limit:
+            self.drift.append({
+                "ad_id": ad.id, "account_id": ad.account_id, "item_id": ad.item_id,
+                "stored": stored, "actual": actual, "difference": actual - stored,
+            })
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "checked": self.checked,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "drifted": self.drift_count,
+            "drift": self.drift,
+        }
+
+
+class BidSync:
+    def __init__(self, store, fetch, bid_queue, workers=4, rate_per_account=2):
+        self._store = store
+        self._fetch = fetch  # fetch(account, item_id) -> ставка в копейках или BidSyncError
+        self._bid_queue = bid_queue
+        self.workers = workers
+        self.rate_per_account = rate_per_account
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._running = threading.Lock()
+        self.last_report = None
+
+    def _limiter(self, account_id):
+        with self._lock:
+            limiter = self._limiters.get(account_id)
+            if limiter is None:
+                limiter = self._limiters[account_id] = RateLimiter(self.rate_per_account)
+            return limiter
+
+    def _check(self, account, ad):
+        """Возвращает (объявление, ставка до запроса, ставка в Авито, None при ошибке или SKIPPED)"""
+        stored = ad.current_bid
+        if self._bid_queue.busy(ad.item_id):
+            return ad, stored, SKIPPED
+        try:
+            return ad, stored, self._fetch(account, ad.item_id)
+        except Exception as e:
+            logger.warning("Объявление ID %s: не удалось получить ставку — %s", ad.id, e)
+            return ad, stored, None
+
+    def run(self, accounts):
+        """Сверяет ставки всех объявлений аккаунтов; возвращает отчет или None, если сверка уже идет"""
+        if not self._running.acquire(blocking=False):
+            logger.info("Сверка ставок уже выполняется")
+            return None
+        try:
+            report = BidSyncReport(time.time())
+            drifted = self._collect(accounts, report)
+            self._write_back(drifted, report)
+            report.finished_at = time.time()
+            self.last_report = report
+            return report
+        finally:
+            self._running.release()
+
+    def _collect(self, accounts, report):
+        drifted = []
+        slots = threading.BoundedSemaphore(2 * self.workers)
+
+        def done(future):
+            slots.release()
+            ad, stored, actual = future.result()
+            with self._lock:
+                if actual is SKIPPED:
+                    report.skipped += 1
+                    return
+                if actual is None:
+                    report.errors += 1
+                    return
+                report.checked += 1
+                if actual != stored:
+                    drifted.append((ad, stored, actual))
+
+        sources = {}
+        ready = []  # (когда у аккаунта появится токен, номер, account_id)
+        for n, account in enumerate(accounts):
+            ads = (ad for ad in self._store.iter_account_ads(account.id) if ad.item_id)
+            sources[account.id] = (account, ads)
+            ready.append((0, n, account.id))
+        order = len(ready)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bid-sync") as executor:
+            while ready:
+                when, _, account_id = heapq.heappop(ready)
+                delay = when - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)  # раньше токен не появится ни у одного аккаунта
+                order += 1
+                delay = self._limiter(account_id).try_acquire()
+                if delay:
+                    heapq.heappush(ready, (time.monotonic() + delay, order, account_id))
+                    continue
+                account, ads = sources[account_id]
+                ad = next(ads, None)
+                if ad is None:
+                    del sources[account_id]
+                    continue
+                slots.acquire()
+                executor.submit(self._check, account, ad).add_done_callback(done)
+                heapq.heappush(ready, (time.monotonic(), order, account_id))
+        return drifted
+
+    def _write_back(self, drifted, report):
+        with self._store.batch():
+            for ad, stored, actual in drifted:
+                current = self._store.get_ad(ad.id)
+                if current is None or current.current_bid != stored or self._bid_queue.busy(current.item_id):
+                    report.checked -= 1  # учтено при запросе, но не сверено
+                    report.skipped += 1
+                    continue
+                self._store.update_ad(current, current_bid=actual)
+                self._bid_queue.forget(current.item_id)
+                report.add_drift(current, stored, actual)
@@ -0,0 +1,169 @@
+"""
+Стратегии изменения ставки по позиции объявления в выдаче.
+
+Стратегия получает объявление, его текущую позицию и состояние
+(известные границы ставки) и предлагает новую ставку или None, если
+менять ничего не нужно. BidController добавляет к этому общие правила:
+паузу после изменения (cooldown), ограничение максимальной ставкой
+объявления, нижнюю границу ставки (min_bid, но не меньше bid_step
+объявления), ограничение снижения за один раз (не больше max_decrease
+от текущей ставки) и сброс устаревших границ.
+
+Позиция "выше диапазона" – это меньший номер (объявление показывается
+раньше, чем нужно, и мы переплачиваем), "ниже диапазона" – больший номер.
+"""
+import threading
+import time
+
+
+class BidState:
+    __slots__ = ("low", "high", "streak", "changed_at")
+
+    def __init__(self):
+        self.low = None      # наибольшая ставка, при которой позиция была ниже диапазона
+        self.high = None     # наименьшая ставка, при которой позиция была выше диапазона
+        self.streak = 0      # число изменений подряд в одну сторону (знак – направление)
+        self.changed_at = 0
+
+
+class StepStrategy:
+    """Прежнее поведение: при выходе из диапазона ставка растет на bid_step"""
+    name = "step"
+
+    def propose(self, ad, position, state):
+        lower, upper = ad.position_range
+        if lower <= position <= upper:
+            return None
+        return ad.current_bid + ad.bid_step
+
+
+class BisectionStrategy:
+    """
+    Поиск нужной ставки делением отрезка пополам. Пока известна только
+    одна граница, шаг удваивается с каждым изменением в ту же сторону
+    (не больше max_multiplier шагов); когда известны обе – новая ставка
+    берется посередине между ними.
+    """
+    name = "bisection"
+
+    def __init__(self, max_multiplier=8):
+        self.max_multiplier = max_multiplier
+
+    def propose(self, ad, position, state):
+        lower, upper = ad.position_range
+        bid = ad.current_bid
+        step = max(ad.bid_step, 1)
+        if position > upper:
+            state.low = bid
+            if state.high is not None and state.high <= bid:
+                state.high = None  # аукцион изменился, прежняя верхняя граница уже не достаточна
+            if state.high is None:
+                state.streak = state.streak + 1 if state.streak > 0 else 1
+                return bid + step * self._multiplier(state.streak)
+            state.streak = 0
+            if state.high - state.low <= step:
+                return state.high
+            return (state.low + state.high) // 2
+        if position < lower:
+            state.high = bid
+            if state.low is not None and state.low >= bid:
+                state.low = None
+            if state.low is None:
+                state.streak = state.streak - 1 if state.streak < 0 else -1
+                return max(bid - step * self._multiplier(-state.streak), 0)
+            state.streak = 0
+            if state.high - state.low <= step:
+                return None  # точнее шага не разделить – остаемся на заведомо достаточной ставке
+            return (state.low + state.high) // 2
+        state.streak = 0
+        return None
+
+    def _multiplier(self, streak):
+        return min(2 ** (streak - 1), self.max_multiplier)
+
+
+class ProportionalStrategy:
+    """
+    Изменение ставки пропорционально отклонению позиции от середины
+    диапазона: gain шагов на каждую позицию отклонения, но не меньше
+    одного и не больше max_multiplier шагов за раз.
+    """
+    name = "proportional"
+
+    def __init__(self, gain=0.5, max_multiplier=8):
+        self.gain = gain
+        self.max_multiplier = max_multiplier
+
+    def propose(self, ad, position, state):
+        lower, upper = ad.position_range
+        if lower <= position <= upper:
+            return None
+        step = max(ad.bid_step, 1)
+        error = position - (lower + upper) / 2
+        steps = min(max(abs(error) * self.gain, 1), self.max_multiplier)
+        delta = int(round(steps * step))
+        return max(ad.current_bid + (delta if error > 0 else -delta), 0)
+
+
+STRATEGIES = {
+    StepStrategy.name: StepStrategy,
+    BisectionStrategy.name: BisectionStrategy,
+    ProportionalStrategy.name: ProportionalStrategy,
+}
+
+
+def make_strategy(name):
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестная стратегия ставок: {name}") from None
+
+
+class BidController:
+    def __init__(self, strategy, cooldown=120, bound_ttl=6 * 3600, min_bid=0, max_decrease=0.5):
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.bound_ttl = bound_ttl  # через это время без изменений границы считаются устаревшими
+        self.min_bid = min_bid  # в копейках; фактическая нижняя граница – не меньше bid_step объявления
+        self.max_decrease = max_decrease  # доля текущей ставки, на которую ее можно снизить за раз
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def next_bid(self, ad, position, now=None):
+        """Новая ставка в копейках или None, если ставку менять не нужно"""
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(ad.id)
+            if state is None:
+                state = self._states[ad.id] = BidState()
+            if now - state.changed_at < self.cooldown:
+                return None
+            if state.changed_at and now - state.changed_at > self.bound_ttl:
+                state.low = state.high = None
+                state.streak = 0
+            proposal = self.strategy.propose(ad, position, state)
+            if proposal is None:
+                return None
+            proposal = self._limit(ad, int(proposal))
+            if proposal is None or proposal == ad.current_bid:
+                return None
+            state.changed_at = now
+            return proposal
+
+    def _limit(self, ad, proposal):
+        """Применяет общие ограничения; None – снижать ставку дальше нельзя"""
+        floor = max(self.min_bid, ad.bid_step, 0)
+        if proposal < ad.current_bid:
+            proposal = max(proposal, floor, int(ad.current_bid * (1 - self.max_decrease)))
+            if proposal >= ad.current_bid:
+                return None  # ставка уже на нижней границе
+        else:
+            proposal = max(proposal, floor)
+        if ad.max_bid:
+            proposal = min(proposal, ad.max_bid)
+        return proposal
+
+    def reset(self, ad_id):
+        """Забывает границы объявления – например, после ручного изменения ставки"""
+        with self._lock:
+            self._states.pop(ad_id, None)
@@ -0,0 +1,171 @@
+"""
+Массовый импорт и экспорт аккаунтов и объявлений в CSV и NDJSON.
+
+Оба направления потоковые: read_rows читает строки по одной из файлового
+объекта, write_rows отдает текст выгрузки по частям, поэтому ни загружаемый
+файл, ни выгрузка целиком в памяти не держатся.
+
+Суммы в файлах – в рублях (формат "10.20"), как в формах приложения.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from extractor import extract_item_id
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+WRITE_BUFFER_SIZE = 64 * 1024  # выгрузка CSV отдается кусками примерно такого размера
+
+ACCOUNT_FIELDS = ("id", "avito_user_id", "client_id", "client_secret")
+AD_FIELDS = (
+    "id", "ad_link", "search_link", "lower_range", "upper_range",
+    "bid_step", "current_bid", "max_bid", "item_id"
+)
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(name, content_type=""):
+    """Формат по явному параметру, иначе по Content-Type (по умолчанию CSV)"""
+    if name:
+        if name not in FORMATS:
+            raise RowError(f"неизвестный формат {name}, допустимы: {', '.join(FORMATS)}")
+        return name
+    return "ndjson" if "json" in (content_type or "") else "csv"
+
+
+def read_rows(stream, fmt):
+    """
+    Отдает (номер строки, словарь полей) из бинарного потока. Если файл
+    дальше читать нельзя (не UTF-8, испорченный CSV), бросает RowError.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        yield from _csv_rows(text) if fmt == "csv" else _ndjson_rows(text)
+    except UnicodeDecodeError:
+        raise RowError("файл должен быть в кодировке UTF-8") from None
+
+
+def _csv_rows(text):
+    reader = csv.DictReader(text)
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        raise RowError(f"строка {reader.line_num}: некорректный CSV — {e}") from None
+
+
+def _ndjson_rows(text):
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, RowError(f"некорректный JSON: {e}")
+            continue
+        yield line_num, row if isinstance(row, dict) else RowError("ожидается объект JSON")
+
+
+def write_rows(rows, fields, fmt):
+    """Отдает текст выгрузки по частям; rows – последовательность словарей"""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= WRITE_BUFFER_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+    for row in rows:
+        yield json.dumps({field: row.get(field) for field in fields}, ensure_ascii=False) + "\n"
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def format_rubles(kopecks):
+    return f"{kopecks / 100.0:.2f}"
+
+
+def parse_rubles(value, field, required=True):
+    if value in (None, ""):
+        if required:
+            raise RowError(f"не указано поле {field}")
+        return 0
+    try:
+        kopecks = int(round(float(str(value).replace(",", ".")) * 100))
+    except (ValueError, OverflowError):
+        raise RowError(f"{field}: ожидается сумма в рублях, получено {value!r}") from None
+    if kopecks < 0:
+        raise RowError(f"{field}: сумма не может быть отрицательной")
+    return kopecks
+
+
+def parse_int(value, field):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field}: ожидается целое число, получено {value!r}") from None
+
+
+def ad_row(row):
+    """
+    Проверяет строку импорта объявления и возвращает поля для Store.add_ads
+    (без account_id). item_id берется из строки или извлекается из ad_link.
+    """
+    ad_link = (row.get("ad_link") or "").strip()
+    if not ad_link.startswith(("http://", "https://")):
+        raise RowError("ad_link: ожидается ссылка http(s)")
+    search_link = (row.get("search_link") or "").strip()
+    if search_link and not search_link.startswith(("http://", "https://")):
+        raise RowError("search_link: ожидается ссылка http(s)")
+    lower = parse_int(row.get("lower_range"), "lower_range")
+    upper = parse_int(row.get("upper_range"), "upper_range")
+    if not 1 <= lower <= upper:
+        raise RowError("диапазон позиций: нужно 1 <= lower_range <= upper_range")
+    item_id = str(row.get("item_id") or "").strip() or extract_item_id(ad_link)
+    return (
+        ad_link, search_link, lower, upper,
+        parse_rubles(row.get("bid_step"), "bid_step"),
+        parse_rubles(row.get("current_bid"), "current_bid"),
+        item_id,
+        parse_rubles(row.get("max_bid"), "max_bid", required=False),
+    )
+
+
+def account_row(row):
+    values = []
+    for field in ("avito_user_id", "client_id", "client_secret"):
+        value = str(row.get(field) or "").strip()
+        if not value:
+            raise RowError(f"не указано поле {field}")
+        values.append(value)
+    return tuple(values)
+
+
+def ad_record(ad):
+    return {
+        "id": ad.id, "ad_link": ad.ad_link, "search_link": ad.search_link,
+        "lower_range": ad.position_range.lower, "upper_range": ad.position_range.upper,
+        "bid_step": format_rubles(ad.bid_step), "current_bid": format_rubles(ad.current_bid),
+        "max_bid": format_rubles(ad.max_bid), "item_id": ad.item_id or "",
+    }
+
+
+def account_record(account):
+    return {field: getattr(account, field) for field in ACCOUNT_FIELDS}
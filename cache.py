@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+
+def normalize_search_link(link: str) -> str:
+    """
+    Приводит ссылку на выдачу к единому виду, чтобы одинаковые выдачи
+    попадали в один элемент кеша: схема и хост в нижнем регистре,
+    параметры отсортированы, фрагмент и завершающий слеш отброшены.
+    """
+    parsed = urlparse(link.strip())
+    path = parsed.path
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), path, "", query, ""))
+
+
+def search_page_link(link: str, page: int) -> str:
+    """Ссылка на страницу page выдачи: номер страницы передается параметром p"""
+    parsed = urlparse(link)
+    query = [(name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True) if name != "p"]
+    if page > 1:
+        query.append(("p", str(page)))
+    return urlunparse(parsed._replace(query=urlencode(query), fragment=""))
+
+
+class CacheEntry:
+    __slots__ = ("positions", "complete", "timestamp", "etag", "last_modified", "links")
+
+    def __init__(self, positions, complete, timestamp, etag=None, last_modified=None, links=None):
+        self.positions = positions
+        self.complete = complete  # False, если разбор страницы был остановлен досрочно
+        self.links = len(positions) if links is None else links  # ссылок на странице, включая повторы
+        self.timestamp = timestamp
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class SearchCache:
+    """
+    Кеш разобранных выдач: ключ – нормализованная ссылка на выдачу,
+    значение – словарь позиций (ключ объявления -> позиция).
+    Элементы устаревают через ttl секунд, при превышении max_entries
+    вытесняются наименее используемые. Устаревший элемент не удаляется
+    сразу – его ETag/Last-Modified используются для условного запроса.
+    """
+
+    def __init__(self, ttl=300, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.timestamp < self.ttl
+
+    def put(self, key, positions, complete=True, etag=None, last_modified=None, links=None):
+        entry = CacheEntry(positions, complete, time.time(), etag, last_modified, links)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def touch(self, key):
+        """Продлевает срок жизни элемента после ответа 304 Not Modified"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.timestamp = time.time()
+                self._entries.move_to_end(key)
+            return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,153 @@
+"""
+Локальный каталог объявлений аккаунта, синхронизируемый с /core/v1/items.
+
+Полная синхронизация проходит все страницы списка: первая загружается
+сразу, следующие – окнами по нескольку страниц параллельно, пока страница
+не окажется неполной. Каждая страница сразу записывается в базу. Объявления,
+которых не оказалось в выдаче API, удаляются из каталога.
+
+Инкрементальная синхронизация запрашивает только объявления, измененные
+с даты предыдущей синхронизации (параметр updatedAtFrom), во всех статусах:
+активные обновляются, снятые с публикации удаляются. Раз в full_sync_interval
+секунд вместо нее выполняется полная синхронизация.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+logger = logging.getLogger(__name__)
+
+ITEMS_PATH = "/core/v1/items"
+PER_PAGE = 100  # максимум, который отдает API
+ALL_STATUSES = "active,removed,old,blocked,rejected"
+
+
+class CatalogSyncError(Exception):
+    pass
+
+
+class ItemCatalog:
+    def __init__(self, db, request, page_workers=4, full_sync_interval=24 * 3600):
+        self._db = db
+        self._request = request  # request(method, path, **kwargs) -> Response, например AvitoClient.request
+        self.page_workers = page_workers
+        self.full_sync_interval = full_sync_interval
+        self._pages = ThreadPoolExecutor(max_workers=page_workers, thread_name_prefix="catalog-page")
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-sync")
+        self._running = set()
+        self._lock = threading.Lock()
+
+    # ---------------------------
+    # Чтение каталога
+    # ---------------------------
+    def page(self, account_id, page, per_page=50):
+        """Возвращает (объявления страницы, всего объявлений в каталоге)"""
+        rows = self._db.select_catalog_page(account_id, per_page, (page - 1) * per_page)
+        items = [
+            {"id": item_id, "title": title, "url": url, "status": status, "price": price}
+            for item_id, title, url, status, price in rows
+        ]
+        return items, self._db.count_catalog(account_id)
+
+    def synced_at(self, account_id):
+        return self._db.select_catalog_sync(account_id)[0]
+
+    def is_syncing(self, account_id):
+        return account_id in self._running
+
+    # ---------------------------
+    # Синхронизация
+    # ---------------------------
+    def sync_in_background(self, account):
+        """Ставит синхронизацию аккаунта в фоновую очередь, если она еще не идет"""
+        with self._lock:
+            if account.id in self._running:
+                return False
+            self._running.add(account.id)
+        self._background.submit(self._run_sync, account)
+        return True
+
+    def _run_sync(self, account):
+        try:
+            self.sync(account)
+        except Exception as e:
+            logger.error("Ошибка синхронизации каталога аккаунта %s: %s", account.id, e)
+        finally:
+            with self._lock:
+                self._running.discard(account.id)
+
+    def sync(self, account, full=False):
+        synced_at, full_synced_at = self._db.select_catalog_sync(account.id)
+        started = time.time()
+        if full or not synced_at or started - full_synced_at > self.full_sync_interval:
+            count = self._full_sync(account)
+            self._db.update_catalog_sync(account.id, started, started)
+            logger.info("Каталог аккаунта %s: полная синхронизация, %d объявлений", account.id, count)
+        else:
+            # updatedAtFrom принимает дату, поэтому берем с запасом в один день
+            since = (date.fromtimestamp(synced_at) - timedelta(days=1)).isoformat()
+            changed = self._incremental_sync(account, since)
+            self._db.update_catalog_sync(account.id, started, full_synced_at)
+            logger.info("Каталог аккаунта %s: изменений с %s – %d", account.id, since, changed)
+
+    def _full_sync(self, account):
+        seen = set()
+        for items in self._iter_pages(account, {"status": "active"}):
+            self._store(account.id, items)
+            seen.update(item["id"] for item in items)
+        stale = self._db.select_catalog_ids(account.id) - seen
+        if stale:
+            self._db.delete_catalog_items(account.id, stale)
+        return len(seen)
+
+    def _incremental_sync(self, account, since):
+        changed = 0
+        for items in self._iter_pages(account, {"status": ALL_STATUSES, "updatedAtFrom": since}):
+            self._store(account.id, [item for item in items if item.get("status") == "active"])
+            removed = [item["id"] for item in items if item.get("status") != "active"]
+            if removed:
+                self._db.delete_catalog_items(account.id, removed)
+            changed += len(items)
+        return changed
+
+    def _store(self, account_id, items):
+        if items:
+            self._db.upsert_catalog_items([
+                (account_id, item["id"], item.get("title", ""), item.get("url", ""),
+                 item.get("status", ""), item.get("price"))
+                for item in items
+            ])
+
+    def _fetch_page(self, account, params, page):
+        response = self._request(
+            "GET", ITEMS_PATH, account=account, params=dict(params, per_page=PER_PAGE, page=page)
+        )
+        if response.status_code != 200:
+            raise CatalogSyncError(f"страница {page}: код {response.status_code} — {response.text}")
+        return response.json().get("resources", [])
+
+    def _iter_pages(self, account, params):
+        """Отдает объявления постранично; страницы после первой грузятся окнами параллельно"""
+        items = self._fetch_page(account, params, 1)
+        yield items
+        if len(items) < PER_PAGE:
+            return
+        next_page = 2
+        while True:
+            window = range(next_page, next_page + self.page_workers)
+            futures = [self._pages.submit(self._fetch_page, account, params, page) for page in window]
+            for future in futures:
+                items = future.result()
+                if items:
+                    yield items
+                if len(items) < PER_PAGE:
+                    for rest in futures:
+                        rest.cancel()
+                    return
+            next_page += self.page_workers
+
+    def shutdown(self):
+        self._pages.shutdown(wait=False)
+        self._background.shutdown(wait=False)
@@ -0,0 +1,220 @@
+"""
+Хранение аккаунтов, объявлений и каталога объявлений Авито в SQLite (режим WAL).
+
+Все запросы – постоянные строки с параметрами, поэтому sqlite3 компилирует
+каждый из них один раз и дальше берет подготовленное выражение из кеша
+соединения. Соединение одно на процесс и защищено блокировкой.
+"""
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    avito_user_id TEXT NOT NULL,
+    client_id TEXT NOT NULL,
+    client_secret TEXT NOT NULL,
+    access_token TEXT NOT NULL DEFAULT '',
+    token_expiration REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id INTEGER NOT NULL REFERENCES accounts(id),
+    ad_link TEXT NOT NULL,
+    search_link TEXT NOT NULL DEFAULT '',
+    search_key TEXT NOT NULL DEFAULT '',
+    range_lower INTEGER NOT NULL,
+    range_upper INTEGER NOT NULL,
+    bid_step INTEGER NOT NULL,
+    current_bid INTEGER NOT NULL,
+    item_id TEXT,
+    max_bid INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ads_account_id ON ads(account_id);
+CREATE INDEX IF NOT EXISTS ads_item_id ON ads(item_id);
+CREATE INDEX IF NOT EXISTS ads_search_key ON ads(search_key);
+CREATE TABLE IF NOT EXISTS catalog_items (
+    account_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    url TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    price INTEGER,
+    PRIMARY KEY (account_id, item_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS catalog_sync (
+    account_id INTEGER PRIMARY KEY,
+    synced_at REAL NOT NULL DEFAULT 0,
+    full_synced_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+AD_COLUMNS = (
+    "id, account_id, ad_link, search_link, search_key, range_lower, range_upper, bid_step, current_bid, item_id, max_bid"
+)
+
+SQL_INSERT_ACCOUNT = (
+    "INSERT INTO accounts (avito_user_id, client_id, client_secret, access_token, token_expiration) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SQL_UPDATE_ACCOUNT = (
+    "UPDATE accounts SET avito_user_id = ?, client_id = ?, client_secret = ?, "
+    "access_token = ?, token_expiration = ? WHERE id = ?"
+)
+SQL_SELECT_ACCOUNTS = (
+    "SELECT id, avito_user_id, client_id, client_secret, access_token, token_expiration "
+    "FROM accounts ORDER BY id"
+)
+SQL_INSERT_AD = (
+    "INSERT INTO ads (account_id, ad_link, search_link, search_key, range_lower, range_upper, "
+    "bid_step, current_bid, item_id, max_bid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SQL_UPDATE_AD = (
+    "UPDATE ads SET ad_link = ?, search_link = ?, search_key = ?, range_lower = ?, range_upper = ?, "
+    "bid_step = ?, current_bid = ?, item_id = ?, max_bid = ? WHERE id = ?"
+)
+SQL_SELECT_AD = f"SELECT {AD_COLUMNS} FROM ads WHERE id = ?"
+SQL_SELECT_ACCOUNT_ADS = f"SELECT {AD_COLUMNS} FROM ads WHERE account_id = ? ORDER BY id"
+SQL_SELECT_ACCOUNT_ADS_PAGE = f"SELECT {AD_COLUMNS} FROM ads WHERE account_id = ? AND id > ? ORDER BY id LIMIT ?"
+SQL_SELECT_ACCOUNT_ADS_PAGE_DESC = (
+    f"SELECT {AD_COLUMNS} FROM ads WHERE account_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+)
+SQL_SELECT_ITEM_ADS = f"SELECT {AD_COLUMNS} FROM ads WHERE item_id = ? ORDER BY id"
+SQL_SELECT_SEARCH_ADS = f"SELECT {AD_COLUMNS} FROM ads WHERE search_key = ? ORDER BY id"
+SQL_SELECT_SEARCH_KEYS = "SELECT DISTINCT search_key FROM ads WHERE search_key != ''"
+
+SQL_UPSERT_CATALOG_ITEM = (
+    "INSERT INTO catalog_items (account_id, item_id, title, url, status, price) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (account_id, item_id) DO UPDATE SET "
+    "title = excluded.title, url = excluded.url, status = excluded.status, price = excluded.price"
+)
+SQL_DELETE_CATALOG_ITEM = "DELETE FROM catalog_items WHERE account_id = ? AND item_id = ?"
+SQL_SELECT_CATALOG_IDS = "SELECT item_id FROM catalog_items WHERE account_id = ?"
+SQL_SELECT_CATALOG_PAGE = (
+    "SELECT item_id, title, url, status, price FROM catalog_items "
+    "WHERE account_id = ? ORDER BY item_id DESC LIMIT ? OFFSET ?"
+)
+SQL_COUNT_CATALOG = "SELECT COUNT(*) FROM catalog_items WHERE account_id = ?"
+SQL_SELECT_CATALOG_SYNC = "SELECT synced_at, full_synced_at FROM catalog_sync WHERE account_id = ?"
+SQL_UPSERT_CATALOG_SYNC = (
+    "INSERT INTO catalog_sync (account_id, synced_at, full_synced_at) VALUES (?, ?, ?) "
+    "ON CONFLICT (account_id) DO UPDATE SET synced_at = excluded.synced_at, full_synced_at = excluded.full_synced_at"
+)
+
+
+class Database:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, cached_statements=64)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """Добавляет колонки, появившиеся после создания базы"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ads)")}
+        if "max_bid" not in columns:
+            self._conn.execute("ALTER TABLE ads ADD COLUMN max_bid INTEGER NOT NULL DEFAULT 0")
+
+    # ---------------------------
+    # Аккаунты
+    # ---------------------------
+    def insert_account(self, row):
+        with self._lock, self._conn:
+            return self._conn.execute(SQL_INSERT_ACCOUNT, row).lastrowid
+
+    def insert_accounts(self, rows):
+        """Добавляет аккаунты одной транзакцией; возвращает их id"""
+        with self._lock, self._conn:
+            return [self._conn.execute(SQL_INSERT_ACCOUNT, row).lastrowid for row in rows]
+
+    def update_account(self, row):
+        """row – значения полей в порядке SQL_UPDATE_ACCOUNT, id последним"""
+        with self._lock, self._conn:
+            self._conn.execute(SQL_UPDATE_ACCOUNT, row)
+
+    def select_accounts(self):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_ACCOUNTS).fetchall()
+
+    # ---------------------------
+    # Объявления
+    # ---------------------------
+    def insert_ad(self, row):
+        with self._lock, self._conn:
+            return self._conn.execute(SQL_INSERT_AD, row).lastrowid
+
+    def insert_ads(self, rows):
+        """Добавляет объявления одной транзакцией; возвращает их id"""
+        with self._lock, self._conn:
+            return [self._conn.execute(SQL_INSERT_AD, row).lastrowid for row in rows]
+
+    def update_ads(self, rows):
+        """Записывает изменения нескольких объявлений одной транзакцией"""
+        with self._lock, self._conn:
+            self._conn.executemany(SQL_UPDATE_AD, rows)
+
+    def select_ad(self, ad_id):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_AD, (ad_id,)).fetchone()
+
+    def select_account_ads(self, account_id):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_ACCOUNT_ADS, (account_id,)).fetchall()
+
+    def select_account_ads_page(self, account_id, after_id, limit, descending=False):
+        """Страница объявлений аккаунта, следующих за after_id (по возрастанию или убыванию id)"""
+        sql = SQL_SELECT_ACCOUNT_ADS_PAGE_DESC if descending else SQL_SELECT_ACCOUNT_ADS_PAGE
+        with self._lock:
+            return self._conn.execute(sql, (account_id, after_id, limit)).fetchall()
+
+    def select_item_ads(self, item_id):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_ITEM_ADS, (item_id,)).fetchall()
+
+    def select_search_ads(self, search_key):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_SEARCH_ADS, (search_key,)).fetchall()
+
+    def select_search_keys(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(SQL_SELECT_SEARCH_KEYS)]
+
+    # ---------------------------
+    # Каталог объявлений аккаунта в Авито
+    # ---------------------------
+    def upsert_catalog_items(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany(SQL_UPSERT_CATALOG_ITEM, rows)
+
+    def delete_catalog_items(self, account_id, item_ids):
+        with self._lock, self._conn:
+            self._conn.executemany(SQL_DELETE_CATALOG_ITEM, [(account_id, item_id) for item_id in item_ids])
+
+    def select_catalog_ids(self, account_id):
+        with self._lock:
+            return {row[0] for row in self._conn.execute(SQL_SELECT_CATALOG_IDS, (account_id,))}
+
+    def select_catalog_page(self, account_id, limit, offset):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_CATALOG_PAGE, (account_id, limit, offset)).fetchall()
+
+    def count_catalog(self, account_id):
+        with self._lock:
+            return self._conn.execute(SQL_COUNT_CATALOG, (account_id,)).fetchone()[0]
+
+    def select_catalog_sync(self, account_id):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_CATALOG_SYNC, (account_id,)).fetchone() or (0, 0)
+
+    def update_catalog_sync(self, account_id, synced_at, full_synced_at):
+        with self._lock, self._conn:
+            self._conn.execute(SQL_UPSERT_CATALOG_SYNC, (account_id, synced_at, full_synced_at))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,141 @@
+"""
+Извлечение ссылок объявлений из HTML страницы выдачи.
+
+Основной способ – потоковый сканер на предкомпилированных регулярных
+выражениях: он проходит по документу один раз, не строит DOM и отдает
+href ссылок <a itemprop="url"> по порядку. Комментарии, <script> и <style>
+пропускаются так же, как их пропускает html.parser. Разбор через
+BeautifulSoup оставлен как запасной вариант и эталон для сравнения.
+
+parse_positions – разбор сырого ответа целиком (декодирование, поиск
+ссылок, построение словаря позиций). Функция и все, что она использует,
+находятся на верхнем уровне модуля без побочных эффектов при импорте,
+поэтому ее можно выполнять в пуле процессов.
+"""
+import re
+from html import unescape
+from urllib.parse import urlparse
+
+# Один проход по документу: комментарии, script/style и открывающие теги <a>
+_TOKEN_RE = re.compile(
+    r"<!--.*?-->"
+    r"|<script\b.*?</script\s*>"
+    r"|<style\b.*?</style\s*>"
+    r"""|<a\b((?:[^>"']|"[^"]*"|'[^']*')*)>""",
+    re.IGNORECASE | re.DOTALL
+)
+_ATTR_RE = re.compile(
+    r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?"""
+)
+
+
+def _parse_attrs(raw):
+    attrs = {}
+    for match in _ATTR_RE.finditer(raw):
+        name = match.group(1).lower()
+        # Повторный атрибут перезаписывает прежний – так же ведет себя эталонный разбор через BeautifulSoup
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        if value is None:
+            value = match.group(4) or ""
+        attrs[name] = value
+    return attrs
+
+
+def iter_item_links(html):
+    """Лениво отдает href всех ссылок <a itemprop="url"> в порядке следования"""
+    for match in _TOKEN_RE.finditer(html):
+        raw = match.group(1)
+        if raw is None or "itemprop" not in raw.lower():
+            continue
+        attrs = _parse_attrs(raw)
+        if unescape(attrs.get("itemprop", "")) == "url":
+            yield unescape(attrs.get("href", ""))
+
+
+def extract_links_bs4(html):
+    """Эталонный разбор через BeautifulSoup (полное построение DOM)"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    return [link.get("href", "") for link in soup.find_all("a", itemprop="url")]
+
+
+def extract_links(html, targets=None, key=None, engine="fast"):
+    """
+    Возвращает (список href в порядке позиций, признак полноты списка).
+    Если переданы targets – множество ключей отслеживаемых объявлений
+    и функция key(href), сканирование останавливается, как только все
+    они найдены; в этом случае список может быть неполным.
+    Если быстрый сканер не нашел ни одной ссылки, страница повторно
+    разбирается через BeautifulSoup.
+    """
+    if engine == "bs4":
+        return extract_links_bs4(html), True
+    links = []
+    remaining = set(targets) if targets and key is not None else None
+    for href in iter_item_links(html):
+        links.append(href)
+        if remaining is not None:
+            remaining.discard(key(href))
+            if not remaining:
+                return links, False
+    if not links:
+        return extract_links_bs4(html), True
+    return links, True
+
+
+def extract_item_id(link: str) -> str:
+    """
+    Извлекает item_id из URL объявления.
+    Например, для URL:
+    https://www.avito.ru/moskva/oborudovanie_dlya_biznesa/dizelnyy_generator_100_kvt_v_shumozaschitnom_kozhuhe_4643419676?context=...
+    функция вернет "4643419676"
+    """
+    parsed = urlparse(link)
+    path = parsed.path  # Получаем путь без query-параметров
+    match = re.search(r'(\d+)$', path)
+    if match:
+        return match.group(1)
+    return None
+
+
+def canonical_link(link: str) -> str:
+    parsed = urlparse(link)
+    path = parsed.path
+    if path.startswith('/'):
+        path = path[1:]
+    segments = path.split('/')
+    if len(segments) > 1:
+        return '/'.join(segments[1:])
+    else:
+        return path
+
+
+def position_key(link: str) -> str:
+    """
+    Ключ для сопоставления объявления с позицией в выдаче: item_id из ссылки,
+    а если его нет – каноническая ссылка без города.
+    """
+    return extract_item_id(link) or canonical_link(link)
+
+
+def build_position_index(links):
+    """Один раз переводит ссылки выдачи в словарь ключ -> позиция (учитывается первое вхождение)"""
+    index = {}
+    for idx, href in enumerate(links, start=1):
+        index.setdefault(position_key(href), idx)
+    return index
+
+
+def parse_positions(content, encoding=None, targets=None, engine="fast"):
+    """
+    Разбирает тело ответа (bytes) и возвращает (словарь position_key -> позиция,
+    признак полноты, число просмотренных ссылок). Число ссылок может быть больше
+    размера словаря, если ссылка встречается на странице дважды. Аргументы и
+    результат компактны и сериализуются pickle – между процессами передается
+    только это, а не список ссылок.
+    """
+    html = content.decode(encoding or "utf-8", errors="replace")
+    links, complete = extract_links(html, targets=targets, key=position_key, engine=engine)
+    return build_position_index(links), complete, len(links)
@@ -0,0 +1,62 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class SearchFetcher:
+    """
+    Конкурентная загрузка страниц выдачи.
+    Общее число одновременных запросов ограничено размером пула потоков,
+    число одновременных запросов к одному хосту – отдельным семафором.
+    """
+
+    def __init__(self, max_workers=16, per_host_limit=4, timeout=(5, 20)):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-fetch")
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _host_slot(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
+
+    def fetch(self, url, headers=None):
+        """Загружает одну страницу с учетом лимита на хост"""
+        with self._host_slot(url):
+            return self._session.get(url, headers=headers, timeout=self.timeout)
+
+    def fetch_many(self, urls, func=None):
+        """
+        Загружает все ссылки конкурентно и отдает результаты по мере готовности.
+        Вместо простой загрузки можно передать func(url) – например, загрузку
+        через кеш. Для каждой ссылки возвращается кортеж (url, result, error).
+        """
+        func = func or self.fetch
+        futures = {self._executor.submit(func, url): url for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                yield url, future.result(), None
+            except Exception as e:
+                yield url, None, e
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
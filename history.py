@@ -0,0 +1,180 @@
+"""
+История позиций и ставок объявлений.
+
+Каждая проверка объявления дает отсчет (время, позиция, ставка). Отсчеты
+сначала попадают в буфер объявления в памяти (три растущих array), а
+flush() дописывает их в двоичный файл
+объявления <dir>/<ad_id>.bin – по 12 байт на отсчет: время в секундах
+(uint32), позиция (int32, 0 – не найдено) и ставка в копейках (int32).
+Записанный буфер удаляется, так что в памяти держатся только отсчеты
+с последнего flush(); буфер, набравший buffer_size отсчетов, записывается
+сразу. Файлы только дописываются, отсчеты в них упорядочены по времени, поэтому
+выборка за период читает один файл объявления и находит границы
+двоичным поиском, не затрагивая остальные объявления.
+
+compact() прореживает старые данные: отсчеты старше raw_retention
+сворачиваются в один на интервал downsample_interval (средняя позиция
+среди найденных, последняя ставка), отсчеты старше retention удаляются.
+Повторное прореживание уже прореженных данных ничего не меняет.
+"""
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+RECORD = struct.Struct("<Iii")
+
+
+class SampleBuffer:
+    """Отсчеты объявления, еще не записанные в файл"""
+    __slots__ = ("times", "positions", "bids")
+
+    def __init__(self):
+        self.times = array("I")
+        self.positions = array("i")
+        self.bids = array("i")
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, timestamp, position, bid):
+        self.times.append(timestamp)
+        self.positions.append(position)
+        self.bids.append(bid)
+
+    def samples(self):
+        return zip(self.times, self.positions, self.bids)
+
+
+class _FileTimes:
+    """Последовательность времен отсчетов файла для bisect без чтения всего файла"""
+
+    def __init__(self, f, count):
+        self._f = f
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        self._f.seek(index * RECORD.size)
+        return RECORD.unpack(self._f.read(RECORD.size))[0]
+
+
+class PositionHistory:
+    def __init__(self, directory, buffer_size=256, raw_retention=7 * 86400,
+                 downsample_interval=3600, retention=180 * 86400):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.raw_retention = raw_retention
+        self.downsample_interval = downsample_interval
+        self.retention = retention
+        self._buffers = {}  # ad_id -> SampleBuffer
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # берется раньше _lock, если нужны обе
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, ad_id):
+        return os.path.join(self.directory, f"{int(ad_id)}.bin")
+
+    def record(self, ad_id, timestamp, position, bid):
+        """position=None – объявление не найдено в выдаче"""
+        with self._lock:
+            buffer = self._buffers.get(ad_id)
+            if buffer is None:
+                buffer = self._buffers[ad_id] = SampleBuffer()
+            buffer.append(int(timestamp), position or 0, bid)
+            full = len(buffer) >= self.buffer_size
+        if full:
+            self.flush([ad_id])
+
+    def flush(self, ad_ids=None):
+        """Дописывает в файлы отсчеты, накопленные с прошлого вызова, и освобождает буферы"""
+        with self._io_lock:
+            with self._lock:
+                pending = []
+                for ad_id in list(self._buffers) if ad_ids is None else ad_ids:
+                    buffer = self._buffers.pop(ad_id, None)
+                    if buffer is not None:
+                        pending.append((ad_id, b"".join(RECORD.pack(*s) for s in buffer.samples())))
+            for ad_id, data in pending:
+                with open(self._path(ad_id), "ab") as f:
+                    f.write(data)
+
+    def series(self, ad_id, start=0, end=None, step=None):
+        """
+        Отсчеты объявления за [start, end] – список (время, позиция или None, ставка).
+        step – размер интервала в секундах для усреднения на лету.
+        """
+        end = 2 ** 32 - 1 if end is None else end
+        samples = []
+        with self._io_lock:
+            try:
+                f = open(self._path(ad_id), "rb")
+            except FileNotFoundError:
+                f = None
+            if f is not None:
+                with f:
+                    times = _FileTimes(f, os.fstat(f.fileno()).st_size // RECORD.size)
+                    first = bisect_left(times, start)
+                    last = bisect_right(times, end)
+                    f.seek(first * RECORD.size)
+                    data = f.read((last - first) * RECORD.size)
+                samples = list(RECORD.iter_unpack(data))
+            with self._lock:
+                buffer = self._buffers.get(ad_id)
+                if buffer is not None:
+                    samples.extend(s for s in buffer.samples() if start <= s[0] <= end)
+        if step:
+            samples = downsample(samples, step)
+        return [(t, position or None, bid) for t, position, bid in samples]
+
+    def compact(self, now=None):
+        """Прореживает и обрезает старые данные во всех файлах истории"""
+        now = time.time() if now is None else now
+        raw_cutoff = now - self.raw_retention
+        drop_cutoff = now - self.retention
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            with self._io_lock:
+                with open(path, "rb") as f:
+                    data = f.read()
+                samples = list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]))
+                split = bisect_left([t for t, _, _ in samples], raw_cutoff)
+                if not split:
+                    continue
+                old = [s for s in samples[:split] if s[0] >= drop_cutoff]
+                compacted = downsample(old, self.downsample_interval) + samples[split:]
+                if len(compacted) == len(samples):
+                    continue
+                if not compacted:
+                    os.remove(path)
+                    continue
+                tmp = path + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(b"".join(RECORD.pack(*s) for s in compacted))
+                os.replace(tmp, path)
+
+
+def downsample(samples, step):
+    """Один отсчет на интервал step: начало интервала, средняя позиция среди найденных, последняя ставка"""
+    result = []
+    bucket = None
+    positions = []
+    bid = 0
+    for t, position, sample_bid in samples:
+        start = t - t % step
+        if start != bucket:
+            if bucket is not None:
+                result.append((bucket, round(sum(positions) / len(positions)) if positions else 0, bid))
+            bucket, positions = start, []
+        if position:
+            positions.append(position)
+        bid = sample_bid
+    if bucket is not None:
+        result.append((bucket, round(sum(positions) / len(positions)) if positions else 0, bid))
+    return result
@@ -0,0 +1,71 @@
+"""
+Настройка логирования: записи из рабочих потоков кладутся в очередь
+(QueueHandler) и пишутся в stderr отдельным потоком (QueueListener),
+поэтому вывод логов не задерживает цикл проверки.
+
+В формате json каждая запись – одна строка JSON с временем, уровнем,
+именем логгера, сообщением и дополнительными полями из extra.
+
+Подробные записи по каждому объявлению пишутся только при включенной
+трассировке или для случайной доли выдач (TraceSampler).
+"""
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Атрибуты LogRecord, которые не считаются дополнительными полями записи
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRS and not name.startswith("_"):
+                data[name] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def setup_logging(level="INFO", fmt="json", stream=None):
+    """
+    Подключает к корневому логгеру неблокирующий обработчик через очередь
+    и запускает поток записи. Возвращает QueueListener – его нужно
+    остановить при выходе, чтобы дописать оставшиеся записи.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class TraceSampler:
+    """Решает, писать ли подробные записи: всегда при enabled, иначе для доли rate случаев"""
+
+    def __init__(self, enabled=False, rate=0.0):
+        self.enabled = enabled
+        self.rate = rate
+
+    def sample(self):
+        return self.enabled or (self.rate > 0 and random.random() < self.rate)
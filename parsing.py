@@ -0,0 +1,90 @@
+"""
+Разбор страниц выдачи в пуле процессов.
+
+Загрузка выдач идет в потоках, а разбор HTML – работа для процессора,
+которую потоки из-за GIL выполняют по очереди. PageParser отправляет
+сырое тело ответа в пул процессов и ждет компактный результат
+(словарь позиций), так что страницы разбираются на всех ядрах.
+При workers=0 разбор выполняется в вызывающем потоке – для небольших
+установок, где отдельные процессы не окупаются.
+
+Процессы создаются методом fork сразу при создании пула: приложение
+запускает фоновые потоки при импорте, и дочерние процессы не должны
+ни повторно импортировать его (как при spawn), ни копировать
+блокировки, занятые другими потоками. Поэтому PageParser создается до
+запуска любых потоков приложения, включая поток записи логов.
+
+Если процесс пула погиб (например, его завершил OOM killer), пул
+считается сломанным: страница, на которой это обнаружено, разбирается
+в вызывающем потоке, а пул создается заново. Новые процессы запускаются
+уже при работающих потоках, но выполняют только parse_positions, которая
+не берет блокировок приложения.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from extractor import parse_positions
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers():
+    """Число процессов по умолчанию: по одному на ядро, на одноядерной машине – без пула"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return cpus if cpus > 1 else 0
+
+
+class PageParser:
+    def __init__(self, workers=0, engine="fast"):
+        self.workers = workers
+        self.engine = engine
+        self._pool = None
+        self._context = None
+        self._lock = threading.Lock()
+        if workers > 0:
+            try:
+                self._context = multiprocessing.get_context("fork")
+            except ValueError:
+                logger.warning("fork недоступен, страницы выдачи разбираются в потоках")
+            else:
+                self._pool = self._start_pool()
+
+    def _start_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context)
+        pool.submit(int).result()  # запускаем процессы сейчас, пока других потоков нет
+        return pool
+
+    def parse(self, content, encoding=None, targets=None):
+        """Возвращает (словарь position_key -> позиция, признак полноты, число ссылок)"""
+        pool = self._pool
+        if pool is None:
+            return parse_positions(content, encoding, targets, self.engine)
+        try:
+            return pool.submit(parse_positions, content, encoding, targets, self.engine).result()
+        except BrokenProcessPool:
+            self._restart(pool)
+            return parse_positions(content, encoding, targets, self.engine)
+
+    def _restart(self, broken):
+        """Заменяет сломанный пул новым; из нескольких потоков, заметивших поломку, это делает один"""
+        with self._lock:
+            if self._pool is not broken:
+                return
+            logger.warning("Процесс разбора выдачи завершился аварийно, пул процессов создается заново")
+            broken.shutdown(wait=False)
+            try:
+                self._pool = self._start_pool()
+            except Exception as e:
+                logger.error("Не удалось создать пул процессов разбора, страницы разбираются в потоках — %s", e)
+                self._pool = None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
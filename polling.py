@@ -0,0 +1,134 @@
+"""
+Адаптивное расписание проверки выдач.
+
+У каждой ссылки на выдачу свое время следующей проверки, ссылки лежат
+в очереди с приоритетом по этому времени. Интервал зависит от того, как
+часто между проверками меняются позиции отслеживаемых объявлений:
+волатильность – экспоненциальное скользящее среднее доли изменившихся
+позиций, интервал – геометрическая интерполяция между min_interval
+(позиции меняются каждый раз) и max_interval (не меняются совсем).
+Ссылка, которая сейчас проверяется, не выдается повторно, пока проверка
+не завершится; если в это время запрошена внеочередная проверка,
+ссылка после завершения сразу снова становится к проверке.
+"""
+import heapq
+import threading
+import time
+
+
+class LinkState:
+    __slots__ = ("due", "interval", "volatility", "signature", "rerun")
+
+    def __init__(self, due, interval, volatility):
+        self.due = due
+        self.interval = interval
+        self.volatility = volatility
+        self.signature = None
+        self.rerun = False  # повторить проверку сразу после текущей
+
+
+class AdaptivePoller:
+    def __init__(self, min_interval=60, max_interval=1800, smoothing=0.3, initial_volatility=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.initial_volatility = initial_volatility
+        self._heap = []       # (due, link); устаревшие записи пропускаются при извлечении
+        self._states = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def interval_for(self, volatility):
+        ratio = self.max_interval / self.min_interval
+        return self.min_interval * ratio ** (1 - volatility)
+
+    def sync(self, links, now=None):
+        """Приводит набор отслеживаемых ссылок к links: новые проверяются сразу, исчезнувшие забываются"""
+        now = time.time() if now is None else now
+        links = set(links)
+        with self._lock:
+            for link in list(self._states):
+                if link not in links:
+                    del self._states[link]
+            for link in links:
+                if link not in self._states:
+                    state = LinkState(now, self.interval_for(self.initial_volatility), self.initial_volatility)
+                    self._states[link] = state
+                    heapq.heappush(self._heap, (state.due, link))
+
+    def due(self, now=None, limit=None):
+        """Забирает ссылки, время проверки которых наступило, и помечает их как проверяемые"""
+        now = time.time() if now is None else now
+        links = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and (limit is None or len(links) < limit):
+                due, link = heapq.heappop(self._heap)
+                state = self._states.get(link)
+                if state is None or state.due != due or link in self._in_flight:
+                    continue
+                self._in_flight.add(link)
+                links.append(link)
+        return links
+
+    def claim(self, links):
+        """Помечает ссылки как проверяемые вне расписания; возвращает те, что не проверяются уже сейчас"""
+        with self._lock:
+            claimed = [link for link in links if link not in self._in_flight]
+            self._in_flight.update(claimed)
+        return claimed
+
+    def complete(self, link, signature, now=None):
+        """
+        Завершает проверку ссылки. signature – позиции отслеживаемых объявлений
+        (None, если выдачу получить не удалось – тогда интервал не меняется).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._in_flight.discard(link)
+            state = self._states.get(link)
+            if state is None:
+                return
+            if signature is not None:
+                if state.signature is not None:
+                    changed = self._changed_share(state.signature, signature)
+                    state.volatility += self.smoothing * (changed - state.volatility)
+                    state.interval = self.interval_for(state.volatility)
+                state.signature = signature
+            if state.rerun:
+                state.rerun = False
+                self._schedule(link, state, now)
+            else:
+                self._schedule(link, state, now + state.interval)
+
+    def request_now(self, link, now=None):
+        """
+        Переносит проверку ссылки на ближайший такт; если ссылка сейчас
+        проверяется – на ближайший такт после завершения этой проверки.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._states.get(link)
+            if state is None:
+                state = self._states[link] = LinkState(
+                    now, self.interval_for(self.initial_volatility), self.initial_volatility
+                )
+                heapq.heappush(self._heap, (state.due, link))
+            if link in self._in_flight:
+                state.rerun = True
+            elif state.due > now:
+                self._schedule(link, state, now)
+
+    def next_due(self, link):
+        state = self._states.get(link)
+        return state.due if state is not None else None
+
+    def _schedule(self, link, state, due):
+        state.due = due
+        heapq.heappush(self._heap, (due, link))
+
+    @staticmethod
+    def _changed_share(old, new):
+        keys = set(old) | set(new)
+        if not keys:
+            return 0.0
+        return sum(1 for key in keys if old.get(key) != new.get(key)) / len(keys)
@@ -0,0 +1,338 @@
+"""
+Хранилище аккаунтов и объявлений с индексами по id аккаунта,
+id объявления, item_id и ссылке на выдачу.
+
+Без базы данных все записи живут только в памяти. С базой (db.Database)
+аккаунты читаются при старте, а объявления – лениво, по мере обращения:
+роль индексов по item_id и выдаче играют индексы SQLite, а в памяти
+хранятся только уже прочитанные записи (по одному объекту на объявление).
+"""
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from cache import normalize_search_link
+from extractor import position_key
+
+PositionRange = namedtuple("PositionRange", ["lower", "upper"])
+
+
+class Account:
+    __slots__ = ("id", "avito_user_id", "client_id", "client_secret", "access_token", "token_expiration")
+
+    def __init__(self, id, avito_user_id, client_id, client_secret, access_token="", token_expiration=0):
+        self.id = id
+        self.avito_user_id = avito_user_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = access_token
+        self.token_expiration = token_expiration
+
+    def to_row(self):
+        return (self.avito_user_id, self.client_id, self.client_secret, self.access_token, self.token_expiration)
+
+
+class Ad:
+    __slots__ = (
+        "id", "account_id", "ad_link", "search_link", "position_range", "bid_step", "current_bid", "item_id", "max_bid",
+        "_position_key", "_position_key_link"
+    )
+
+    def __init__(self, id, account_id, ad_link, search_link, position_range, bid_step, current_bid, item_id,
+                 max_bid=0):
+        self.id = id
+        self.account_id = account_id
+        self.ad_link = ad_link
+        self.search_link = search_link
+        self.position_range = position_range
+        self.bid_step = bid_step          # в копейках
+        self.current_bid = current_bid    # в копейках
+        self.item_id = item_id
+        self.max_bid = max_bid            # в копейках, 0 – без ограничения
+        self._position_key = None
+        self._position_key_link = None
+
+    @property
+    def position_key(self):
+        """Ключ объявления в выдаче; вычисляется один раз, пока не изменится ad_link"""
+        if self._position_key_link != self.ad_link:
+            self._position_key = position_key(self.ad_link)
+            self._position_key_link = self.ad_link
+        return self._position_key
+
+    @property
+    def search_key(self):
+        return normalize_search_link(self.search_link) if self.search_link else ""
+
+    def to_row(self):
+        """Значения полей в порядке колонок UPDATE/INSERT (без id и account_id)"""
+        return (
+            self.ad_link, self.search_link, self.search_key,
+            self.position_range.lower, self.position_range.upper,
+            self.bid_step, self.current_bid, self.item_id, self.max_bid
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        ad_id, account_id, ad_link, search_link, _, lower, upper, bid_step, current_bid, item_id, max_bid = row
+        return cls(
+            ad_id, account_id, ad_link, search_link, PositionRange(lower, upper),
+            bid_step, current_bid, item_id, max_bid
+        )
+
+
+class Store:
+    """
+    Все изменения выполняются через методы хранилища, чтобы индексы
+    оставались согласованными. Методы чтения, возвращающие несколько
+    объектов, отдают снимок, который безопасно обходить из другого потока.
+
+    Внутри `with store.batch():` изменения объявлений копятся и пишутся
+    в базу одной транзакцией при выходе из блока (отдельно для каждого потока).
+    """
+
+    def __init__(self, db=None):
+        self._db = db
+        self._lock = threading.RLock()
+        self._batch = threading.local()
+        self._accounts = {}
+        self._ads = {}
+        self._account_ads = {}     # account_id -> {ad_id: Ad}
+        self._by_item_id = {}      # item_id -> {ad_id: Ad}
+        self._by_search_link = {}  # нормализованный search_link -> {ad_id: Ad}
+        self._loaded_accounts = set()
+        self._next_account_id = 1
+        self._next_ad_id = 1
+        if db is not None:
+            for row in db.select_accounts():
+                account = Account(*row)
+                self._accounts[account.id] = account
+                self._account_ads[account.id] = {}
+
+    # ---------------------------
+    # Аккаунты
+    # ---------------------------
+    def add_account(self, avito_user_id, client_id, client_secret):
+        with self._lock:
+            account = Account(self._next_account_id, avito_user_id, client_id, client_secret)
+            if self._db is not None:
+                account.id = self._db.insert_account(account.to_row())
+            else:
+                self._next_account_id += 1
+            self._accounts[account.id] = account
+            self._account_ads[account.id] = {}
+            self._loaded_accounts.add(account.id)
+            return account
+
+    def add_accounts(self, rows):
+        """Добавляет аккаунты одной транзакцией; rows – кортежи (avito_user_id, client_id, client_secret)"""
+        with self._lock:
+            accounts = [Account(None, *row) for row in rows]
+            if self._db is not None:
+                ids = self._db.insert_accounts([account.to_row() for account in accounts])
+            else:
+                ids = range(self._next_account_id, self._next_account_id + len(accounts))
+                self._next_account_id += len(accounts)
+            for account, account_id in zip(accounts, ids):
+                account.id = account_id
+                self._accounts[account.id] = account
+                self._account_ads[account.id] = {}
+                self._loaded_accounts.add(account.id)
+            return accounts
+
+    def update_account(self, account, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(account, name, value)
+            if self._db is not None:
+                self._db.update_account(account.to_row() + (account.id,))
+            return account
+
+    def get_account(self, account_id):
+        return self._accounts.get(account_id)
+
+    def accounts(self):
+        with self._lock:
+            return list(self._accounts.values())
+
+    # ---------------------------
+    # Объявления
+    # ---------------------------
+    def add_ad(self, account_id, ad_link, search_link, lower, upper, bid_step, current_bid, item_id, max_bid=0):
+        with self._lock:
+            ad = Ad(
+                self._next_ad_id, account_id, ad_link, search_link,
+                PositionRange(lower, upper), bid_step, current_bid, item_id, max_bid
+            )
+            if self._db is not None:
+                ad.id = self._db.insert_ad((account_id,) + ad.to_row())
+            else:
+                self._next_ad_id += 1
+            self._remember(ad)
+            return ad
+
+    def add_ads(self, account_id, rows):
+        """
+        Добавляет объявления аккаунта одной транзакцией. rows – кортежи
+        (ad_link, search_link, lower, upper, bid_step, current_bid, item_id, max_bid).
+        """
+        ads = [
+            Ad(None, account_id, ad_link, search_link, PositionRange(lower, upper),
+               bid_step, current_bid, item_id, max_bid)
+            for ad_link, search_link, lower, upper, bid_step, current_bid, item_id, max_bid in rows
+        ]
+        with self._lock:
+            if self._db is not None:
+                ids = self._db.insert_ads([(account_id,) + ad.to_row() for ad in ads])
+            else:
+                ids = range(self._next_ad_id, self._next_ad_id + len(ads))
+                self._next_ad_id += len(ads)
+            for ad, ad_id in zip(ads, ids):
+                ad.id = ad_id
+                # Объявления еще не прочитанного аккаунта загрузятся из базы при обращении
+                if self._db is None or account_id in self._loaded_accounts:
+                    self._remember(ad)
+        return ads
+
+    def update_ad(self, ad, **fields):
+        """Изменяет поля объявления; lower/upper задают position_range"""
+        with self._lock:
+            self._unindex(ad)
+            if "lower" in fields or "upper" in fields:
+                ad.position_range = PositionRange(
+                    fields.pop("lower", ad.position_range.lower),
+                    fields.pop("upper", ad.position_range.upper)
+                )
+            for name, value in fields.items():
+                setattr(ad, name, value)
+            self._index(ad)
+        if self._db is not None:
+            dirty = getattr(self._batch, "dirty", None)
+            if dirty is not None:
+                dirty[ad.id] = ad
+            else:
+                self._db.update_ads([ad.to_row() + (ad.id,)])
+        return ad
+
+    @contextmanager
+    def batch(self):
+        """Откладывает запись изменений объявлений до конца блока и пишет их одной транзакцией"""
+        if getattr(self._batch, "dirty", None) is not None:
+            yield  # вложенный блок – запись выполнит внешний
+            return
+        self._batch.dirty = {}
+        try:
+            yield
+        finally:
+            dirty, self._batch.dirty = self._batch.dirty, None
+            if dirty and self._db is not None:
+                self._db.update_ads([ad.to_row() + (ad.id,) for ad in dirty.values()])
+
+    def get_ad(self, ad_id, account_id=None):
+        ad = self._ads.get(ad_id)
+        if ad is None and self._db is not None:
+            row = self._db.select_ad(ad_id)
+            if row is not None:
+                ad = self._load(row)
+        if ad is None or (account_id is not None and ad.account_id != account_id):
+            return None
+        return ad
+
+    def account_ads(self, account_id):
+        if self._db is not None and account_id not in self._loaded_accounts and account_id in self._accounts:
+            rows = self._db.select_account_ads(account_id)
+            with self._lock:
+                for row in rows:
+                    self._load(row)
+                self._loaded_accounts.add(account_id)
+        with self._lock:
+            return sorted(self._account_ads.get(account_id, {}).values(), key=lambda ad: ad.id)
+
+    def account_ads_page(self, account_id, after_id=None, limit=100, descending=False):
+        """
+        До limit объявлений аккаунта, следующих по id за after_id. Страница читается
+        из базы без загрузки объявлений в память хранилища (уже загруженные берутся оттуда).
+        """
+        if self._db is None or account_id in self._loaded_accounts:
+            ads = self.account_ads(account_id)
+            if descending:
+                ads.reverse()
+                ads = [ad for ad in ads if after_id is None or ad.id < after_id]
+            else:
+                ads = [ad for ad in ads if after_id is None or ad.id > after_id]
+            return ads[:limit]
+        if after_id is None:
+            after_id = 2 ** 63 - 1 if descending else 0
+        rows = self._db.select_account_ads_page(account_id, after_id, limit, descending)
+        return [self._ads.get(row[0]) or Ad.from_row(row) for row in rows]
+
+    def iter_account_ads(self, account_id, chunk_size=500):
+        """Обходит объявления аккаунта по id, читая их страницами по chunk_size"""
+        after_id = None
+        while True:
+            ads = self.account_ads_page(account_id, after_id, chunk_size)
+            yield from ads
+            if len(ads) < chunk_size:
+                return
+            after_id = ads[-1].id
+
+    def ads_by_item_id(self, item_id):
+        if self._db is not None:
+            return [self._load(row) for row in self._db.select_item_ads(str(item_id))]
+        with self._lock:
+            return list(self._by_item_id.get(str(item_id), {}).values())
+
+    def ads_by_search_link(self, search_link):
+        key = normalize_search_link(search_link)
+        if self._db is not None:
+            return [self._load(row) for row in self._db.select_search_ads(key)]
+        with self._lock:
+            return list(self._by_search_link.get(key, {}).values())
+
+    def search_links(self):
+        """Нормализованные ссылки всех выдач, по которым отслеживаются объявления"""
+        if self._db is not None:
+            return self._db.select_search_keys()
+        with self._lock:
+            return list(self._by_search_link)
+
+    # ---------------------------
+    # Индексы
+    # ---------------------------
+    def _load(self, row):
+        """Возвращает объект объявления для строки базы, не создавая дубликатов"""
+        with self._lock:
+            ad = self._ads.get(row[0])
+            if ad is None:
+                ad = Ad.from_row(row)
+                self._remember(ad)
+            return ad
+
+    def _remember(self, ad):
+        self._ads[ad.id] = ad
+        self._account_ads.setdefault(ad.account_id, {})[ad.id] = ad
+        self._index(ad)
+
+    def _index(self, ad):
+        if self._db is not None:
+            return  # с базой поиск по item_id и выдаче идет через индексы SQLite
+        if ad.item_id:
+            self._by_item_id.setdefault(str(ad.item_id), {})[ad.id] = ad
+        if ad.search_link:
+            self._by_search_link.setdefault(ad.search_key, {})[ad.id] = ad
+
+    def _unindex(self, ad):
+        if self._db is not None:
+            return
+        if ad.item_id:
+            self._discard(self._by_item_id, str(ad.item_id), ad.id)
+        if ad.search_link:
+            self._discard(self._by_search_link, ad.search_key, ad.id)
+
+    @staticmethod
+    def _discard(index, key, ad_id):
+        group = index.get(key)
+        if group is not None:
+            group.pop(ad_id, None)
+            if not group:
+                del index[key]
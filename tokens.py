@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """
+    Токены доступа аккаунтов.
+
+    Обновление выполняется по принципу single-flight: на каждый аккаунт
+    своя блокировка, и если несколько потоков одновременно обнаружили
+    истекший токен, запрос к /token/ делает только первый, остальные
+    дожидаются его результата. renew_expiring() вызывается фоновой задачей
+    и обновляет токены заранее, до истечения срока, чтобы рабочие запросы
+    не ждали получения токена. После неудачного обновления повторная
+    попытка делается не раньше чем через retry_after секунд.
+    """
+
+    def __init__(self, refresh, renew_before=600, retry_after=30):
+        self._refresh = refresh  # refresh(account) -> True, если токен получен
+        self.renew_before = renew_before
+        self.retry_after = retry_after
+        self._locks = {}
+        self._failed_at = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, account):
+        with self._guard:
+            lock = self._locks.get(account.id)
+            if lock is None:
+                lock = self._locks[account.id] = threading.Lock()
+            return lock
+
+    @staticmethod
+    def is_valid(account, margin=0):
+        return bool(account.access_token) and time.time() + margin < account.token_expiration
+
+    def get(self, account):
+        """Возвращает действующий токен, при необходимости дождавшись обновления"""
+        if self.is_valid(account):
+            return account.access_token
+        with self._lock(account):
+            # Пока ждали блокировку, токен мог обновить другой поток
+            if not self.is_valid(account) and not self._recently_failed(account):
+                self._do_refresh(account)
+        return account.access_token
+
+    def invalidate(self, account, token):
+        """Сбрасывает токен, отвергнутый API (401), если его еще не заменили новым"""
+        with self._lock(account):
+            if account.access_token == token:
+                logger.info("Токен аккаунта %s отклонен API, будет получен новый", account.id)
+                account.token_expiration = 0
+                self._failed_at.pop(account.id, None)
+
+    def renew_expiring(self, accounts):
+        """Заранее обновляет токены, срок которых истекает в ближайшие renew_before секунд"""
+        for account in accounts:
+            if self.is_valid(account, margin=self.renew_before) or self._recently_failed(account):
+                continue
+            lock = self._lock(account)
+            if not lock.acquire(blocking=False):
+                continue  # обновление уже идет
+            try:
+                if not self.is_valid(account, margin=self.renew_before):
+                    self._do_refresh(account)
+            finally:
+                lock.release()
+
+    def _recently_failed(self, account):
+        failed_at = self._failed_at.get(account.id)
+        return failed_at is not None and time.time() - failed_at < self.retry_after
+
+    def _do_refresh(self, account):
+        try:
+            ok = self._refresh(account)
+        except Exception as e:
+            logger.error("Ошибка обновления токена для аккаунта %s: %s", account.id, e)
+            ok = False
+        if ok:
+            self._failed_at.pop(account.id, None)
+        else:
+            self._failed_at[account.id] = time.time()